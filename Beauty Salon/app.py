@@ -1,34 +1,142 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Blueprint, Flask, Response, current_app, render_template, request, redirect, url_for, flash, session, jsonify
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload, make_transient_to_detached
+from sqlalchemy.exc import IntegrityError
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 import os
 import uuid
-from flask import jsonify
+import hashlib
 from flask_wtf.csrf import CSRFProtect
 from markupsafe import Markup
 import json
+import random
+import re
+import click
+import queue
+import threading
+from time import monotonic
 from datetime import datetime, timedelta
+import migrations
+from assets import Assets
+from compression import Compress
+from db_routing import ReadReplica, RoutingSession
+from image_variants import ImageVariants
+from metrics import Metrics
+from outbox import OutboxWorker
+from password_hashing import HashingBusy, PasswordHasher
+from profiling import Profiler
+from pubsub import PubSub
+from response_cache import LRUCache, PageCache
+from sqlite_tuning import SQLiteTuning
 
-# Initialize Flask app
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'beautysalon-secretkey-2025'  # Make sure this is set
-csrf = CSRFProtect(app)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///salon.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = 'static/uploads'
+# Extensions are created unbound and attached to an app in create_app(), so importing
+# this module does no I/O and every pre-forked worker can share the imported code
+csrf = CSRFProtect()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+sqlite_tuning = SQLiteTuning()  # SQLite pragmas (WAL, busy timeout) and periodic checkpoints
+read_replica = ReadReplica()
+metrics = Metrics()  # per-route latency and SQL histograms, slow-query log
+profiler = Profiler()  # opt-in sampling profiles of slow or chosen requests
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+password_hasher = PasswordHasher()  # login and signup hashing, off the request threads
+page_cache = PageCache()  # page cache for anonymous visitors
+pubsub = PubSub()  # live updates
+image_variants = ImageVariants()  # resized images; finished variants expire the cached pages that show them
+assets = Assets()  # bundled, fingerprinted CSS and JS
+compress = Compress()  # compression of HTML and JSON responses
 
-# Ensure upload directory exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+# Routes, hooks and CLI commands; CLI commands are registered without a group prefix
+main = Blueprint('main', __name__, cli_group=None)
 
-# Initialize database
-db = SQLAlchemy(app)
+def database_engine_options(database_uri):
+    # Connection pool per worker process; tune to the database server's connection limit.
+    # An in-memory SQLite database lives in a single connection, so it keeps the default pool.
+    if database_uri in ('sqlite://', 'sqlite:///:memory:'):
+        return {}
+    return {
+        'pool_size': int(os.environ.get('DATABASE_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DATABASE_MAX_OVERFLOW', 20)),
+        'pool_timeout': float(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(os.environ.get('DATABASE_POOL_RECYCLE', 1800)),
+        # A network database may drop idle connections; a local SQLite file never does
+        'pool_pre_ping': not database_uri.startswith('sqlite'),
+    }
 
-# Initialize login manager
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+def create_app(config=None):
+    """Create and configure the application.
+
+    Settings come from the defaults below, then FLASK_* environment variables
+    (FLASK_SECRET_KEY, FLASK_SALONS_PER_PAGE=24, ...), then the config mapping.
+    """
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'beautysalon-secretkey-2025'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///salon.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Optional read replica for read-only routes
+    if os.environ.get('DATABASE_REPLICA_URL'):
+        app.config['SQLALCHEMY_BINDS'] = {'replica': os.environ['DATABASE_REPLICA_URL']}
+    app.config['UPLOAD_FOLDER'] = os.path.join(app.static_folder, 'uploads')
+    app.config['UPLOAD_GC_GRACE_SECONDS'] = 3600  # uploads released or written more recently than this are kept
+    app.config['SALONS_PER_PAGE'] = 12
+    app.config['FEATURED_SALONS'] = 6
+    app.config['REVIEWS_PER_PAGE'] = 10
+    app.config['PAST_APPOINTMENTS_PER_PAGE'] = 10
+    app.config['MAX_SCHEDULE_WEEKS'] = 12
+    app.config['BOOKING_WINDOW_DAYS'] = 30
+    app.config['AVAILABILITY_STEP_MINUTES'] = 15
+    app.config['AVAILABILITY_CACHE_TTL'] = 30  # seconds
+    app.config['AVAILABILITY_CACHE_SIZE'] = 1024
+    app.config['IDENTITY_CACHE_TTL'] = 60  # seconds
+    app.config['IDENTITY_CACHE_SIZE'] = 4096
+    app.config['SSE_KEEPALIVE_SECONDS'] = 15
+    app.config['SSE_MAX_STREAM_SECONDS'] = 300  # clients reconnect, which frees the worker
+    # Live updates hold a request open, so they need a server that runs requests on threads
+    # or greenlets. None turns them on only where the server sets wsgi.multithread
+    app.config['SSE_ENABLED'] = None
+    app.config.from_prefixed_env()
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', database_engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+
+    csrf.init_app(app)
+    db.init_app(app)
+    sqlite_tuning.init_app(app, db)
+    read_replica.init_app(app, db)
+    # First to see each request and last to see its response, so it times everything in between
+    metrics.init_app(app, db)
+    profiler.init_app(app)
+    login_manager.init_app(app)
+    password_hasher.init_app(app)
+    page_cache.init_app(app)
+    pubsub.init_app(app)
+    image_variants.init_app(app, page_cache.bump)
+    assets.init_app(app)
+    compress.init_app(app)
+    outbox_worker.init_app(app, deliver_outbox)
+    # Every snapshot counts as one, so both limits are the entry count
+    app.extensions['identity_cache'] = LRUCache(app.config['IDENTITY_CACHE_SIZE'], app.config['IDENTITY_CACHE_SIZE'])
+    app.register_blueprint(main)
+
+    # A forked worker must not reuse connections the parent opened
+    os.register_at_fork(after_in_child=lambda: dispose_engines(app))
+    return app
+
+def warm_up(app):
+    # Work each worker would otherwise repeat on its first request. Run it once in a
+    # pre-forking master (see wsgi.py) and every forked worker starts with it done.
+    db.configure_mappers()
+    for name in app.jinja_env.list_templates(filter_func=lambda name: name.endswith('.html')):
+        app.jinja_env.get_template(name)
+    app.url_map.update()
+    assets.manifest
+
+def dispose_engines(app):
+    # Drop the pooled connections without closing them, as they still belong to the parent
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
 
 # Database Models
 class User(db.Model, UserMixin):
@@ -40,9 +148,11 @@ class User(db.Model, UserMixin):
     profile_picture = db.Column(db.String(200), default='default_profile.jpg')
     date_created = db.Column(db.DateTime, default=datetime.utcnow)
 
+    salon_id = None  # the owner's salon, filled in by load_user
+
 class Salon(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     location = db.Column(db.String(200), nullable=False)
@@ -50,15 +160,25 @@ class Salon(db.Model):
     opening_time = db.Column(db.String(50))
     closing_time = db.Column(db.String(50))
     weekly_closing = db.Column(db.String(50))  # Day of week when salon is closed
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Sum of all review ratings
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Number of reviews
     images = db.relationship('SalonImage', backref='salon', lazy=True, cascade="all, delete-orphan")
     services = db.relationship('Service', backref='salon', lazy=True, cascade="all, delete-orphan")
     employees = db.relationship('Employee', backref='salon', lazy=True, cascade="all, delete-orphan")
+
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.rating_count if self.rating_count else 0
     
 class SalonImage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     salon_id = db.Column(db.Integer, db.ForeignKey('salon.id'), nullable=False)
     image_path = db.Column(db.String(200), nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_salon_image_salon_id', 'salon_id'),
+    )
+
 class Service(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     salon_id = db.Column(db.Integer, db.ForeignKey('salon.id'), nullable=False)
@@ -67,6 +187,11 @@ class Service(db.Model):
     price = db.Column(db.Float, nullable=False)
     duration = db.Column(db.Integer, nullable=False)  # duration in minutes
 
+    __table_args__ = (
+        db.Index('ix_service_salon_price', 'salon_id', 'price'),
+        db.Index('ix_service_name_salon', 'name', 'salon_id'),
+    )
+
 class Employee(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     salon_id = db.Column(db.Integer, db.ForeignKey('salon.id'), nullable=False)
@@ -74,6 +199,15 @@ class Employee(db.Model):
     role = db.Column(db.String(100))
     image = db.Column(db.String(200), default='default_employee.jpg')
 
+class UploadBlob(db.Model):
+    # One row per stored upload; files are named by content hash and shared between
+    # every SalonImage, Employee and User that uploaded the same bytes
+    path = db.Column(db.String(200), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    date_created = db.Column(db.DateTime, default=datetime.utcnow)
+    released_at = db.Column(db.DateTime)  # when a reference was last dropped
+
 class TimeSlot(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     salon_id = db.Column(db.Integer, db.ForeignKey('salon.id'), nullable=False)
@@ -82,6 +216,10 @@ class TimeSlot(db.Model):
     end_time = db.Column(db.Time, nullable=False)
     is_available = db.Column(db.Boolean, default=True)
 
+    __table_args__ = (
+        db.Index('ix_time_slot_salon_date_available_start', 'salon_id', 'date', 'is_available', 'start_time'),
+    )
+
 class Appointment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -89,6 +227,7 @@ class Appointment(db.Model):
     service_id = db.Column(db.Integer, db.ForeignKey('service.id'), nullable=False)
     date = db.Column(db.Date, nullable=False)
     time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time)  # end of the reserved slots; NULL runs to the end of the day
     status = db.Column(db.String(20), default='pending')  # pending, confirmed, completed, cancelled
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -105,6 +244,11 @@ class Appointment(db.Model):
     salon = db.relationship('Salon', foreign_keys=[salon_id])
     service = db.relationship('Service', foreign_keys=[service_id])
 
+    __table_args__ = (
+        db.Index('ix_appointment_salon_status', 'salon_id', 'status'),
+        db.Index('ix_appointment_customer_date_time', 'customer_id', 'date', 'time'),
+    )
+
 class Review(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -117,6 +261,10 @@ class Review(db.Model):
     customer = db.relationship('User', foreign_keys=[customer_id])
     salon = db.relationship('Salon', foreign_keys=[salon_id])
 
+    __table_args__ = (
+        db.Index('ix_review_salon_date_posted', 'salon_id', 'date_posted'),
+    )
+
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -131,6 +279,16 @@ class Message(db.Model):
     receiver = db.relationship('User', foreign_keys=[receiver_id])
     appointment = db.relationship('Appointment', foreign_keys=[appointment_id])
 
+class NotificationOutbox(db.Model):
+    # Notifications written in the same transaction as the change that caused them;
+    # the outbox worker moves them into Notification in batches
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    type = db.Column(db.String(50))
+    related_id = db.Column(db.Integer)
+
 class Notification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -140,76 +298,768 @@ class Notification(db.Model):
     type = db.Column(db.String(50))  # appointment, message, system
     related_id = db.Column(db.Integer)  # ID of related entity (appointment, message)
 
+    __table_args__ = (
+        db.Index('ix_notification_user_read_timestamp', 'user_id', 'is_read', 'timestamp'),
+    )
+
+# Users recently loaded by load_user are kept in app.extensions['identity_cache'], as
+# detached snapshots with the owner's salon id. An entry is used only while the user's
+# identity stamp is unchanged, so a profile edit in any worker (bump_identity_version)
+# invalidates it everywhere; notifications and bookings leave that stamp alone.
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    identity_cache = current_app.extensions['identity_cache']
+    version = page_cache.version(f'identity-{user_id}')
+    cached = identity_cache.get(user_id)
+    if cached and cached[1] > monotonic() and cached[2] == version:
+        # Attach a copy of the snapshot to this request's session without a query
+        user = db.session.merge(cached[3], load=False)
+        user.salon_id = cached[4]
+        return user
+
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    if user.role == 'salon_owner':
+        user.salon_id = db.session.scalar(db.select(Salon.id).where(Salon.owner_id == user_id).limit(1))
+
+    snapshot = User(**{column.key: getattr(user, column.key) for column in User.__mapper__.column_attrs})
+    make_transient_to_detached(snapshot)
+    identity_cache.set(user_id, (monotonic() + current_app.config['IDENTITY_CACHE_TTL'], version, snapshot, user.salon_id), 1)
+    return user
+
+def get_owner_salon():
+    # The logged-in owner's salon; load_user usually knows its id already
+    if current_user.salon_id is not None:
+        return db.session.get(Salon, current_user.salon_id)
+    return Salon.query.filter_by(owner_id=current_user.id).first()
 
 # Helper Functions
+@main.app_template_filter('escapejs')
 def escapejs_filter(value):
     return Markup(json.dumps(value))
 
-app.jinja_env.filters['escapejs'] = escapejs_filter
+def upload_extension(filename):
+    extension = os.path.splitext(secure_filename(filename))[1].lower()
+    return '.jpg' if extension == '.jpeg' else extension
+
+def store_upload(stream, extension, count=1):
+    # Hash while copying the upload to a temporary file and take `count` references to
+    # it in the caller's transaction; returns (relative path, whether the file was written).
+    # The file is put in place only after the reference is taken. Taking it waits for any
+    # `flask gc-uploads` transaction deleting the same blob, and that transaction may have
+    # removed the file, so a new blob row or a missing file means the file is written again
+    digest = hashlib.sha256()
+    size = 0
+    os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
+    temp_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f".upload-{uuid.uuid4().hex}.tmp")
+    try:
+        with open(temp_path, 'wb') as temp_file:
+            for chunk in iter(lambda: stream.read(64 * 1024), b''):
+                digest.update(chunk)
+                temp_file.write(chunk)
+                size += len(chunk)
+
+        filename = f"{digest.hexdigest()}{extension}"
+        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+        created = retain_upload(f"uploads/{filename}", size, count)
+        if not created and os.path.exists(file_path):
+            return f"uploads/{filename}", False
+        os.replace(temp_path, file_path)
+        return f"uploads/{filename}", True
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+# Every column that can point at a stored upload
+UPLOAD_REFERENCES = [SalonImage.image_path, Employee.image, User.profile_picture]
 
-def save_image(file):
+def retain_upload(path, size=0, count=1):
+    # Count more references to a stored upload, in the caller's transaction; True if
+    # this created the blob row
+    updated = db.session.execute(
+        db.update(UploadBlob).where(UploadBlob.path == path).values(ref_count=UploadBlob.ref_count + count)
+    ).rowcount
+    if updated:
+        return False
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(UploadBlob(path=path, size=size, ref_count=count))
+        return True
+    except IntegrityError:
+        # Another request registered the same content first
+        db.session.execute(
+            db.update(UploadBlob).where(UploadBlob.path == path).values(ref_count=UploadBlob.ref_count + count)
+        )
+        return False
+
+def release_upload(path):
+    # Drop one reference; the file itself is removed later by `flask gc-uploads`
+    if path:
+        db.session.execute(
+            db.update(UploadBlob)
+            .where(UploadBlob.path == path, UploadBlob.ref_count > 0)
+            .values(ref_count=UploadBlob.ref_count - 1, released_at=datetime.utcnow())
+        )
+
+def save_image(file, scopes=()):
+    # Stores the upload by content hash and takes a reference for the caller, who
+    # must assign the returned path in the same transaction
     if file:
-        filename = secure_filename(file.filename)
-        unique_filename = f"{uuid.uuid4()}_{filename}"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(file_path)
-        return f"uploads/{unique_filename}"
+        image_path, is_new = store_upload(file.stream, upload_extension(file.filename))
+        if is_new:
+            image_variants.enqueue(image_path, scopes)
+        return image_path
     return None
 
 def create_notification(user_id, content, notification_type, related_id=None):
-    notification = Notification(
+    # Queued in the caller's transaction; the caller commits and then wakes the outbox worker
+    notification = NotificationOutbox(
         user_id=user_id,
         content=content,
         type=notification_type,
         related_id=related_id
     )
     db.session.add(notification)
+
+def deliver_outbox(limit):
+    # Look before claiming: an idle poll is then one read, never a write lock and a commit
+    if db.session.scalar(db.select(NotificationOutbox.id).limit(1)) is None:
+        return 0
+
+    # Claim a batch by deleting it, so concurrent workers never deliver a row twice
+    oldest =db.select(NotificationOutbox.id).order_by(NotificationOutbox.id).limit(limit)
+    claimed = db.session.execute(
+        db.delete(NotificationOutbox).where(
+            NotificationOutbox.id.in_(oldest)
+        ).returning(
+            NotificationOutbox.user_id,
+            NotificationOutbox.content,
+            NotificationOutbox.timestamp,
+            NotificationOutbox.type,
+            NotificationOutbox.related_id
+        )
+    ).all()
+
+    delivered = []
+    if claimed:
+        delivered = db.session.execute(
+            db.insert(Notification).returning(
+                Notification.id,
+                Notification.user_id,
+                Notification.content,
+                Notification.timestamp,
+                Notification.type
+            ),
+            [{
+                'user_id': row.user_id,
+                'content': row.content,
+                'timestamp': row.timestamp,
+                'type': row.type,
+                'related_id': row.related_id,
+                'is_read': False
+            } for row in claimed]
+        ).all()
     db.session.commit()
 
+    bump_user_version(*{notification.user_id for notification in delivered})
+
+    # Push the new notifications to any open dashboards
+    for notification in delivered:
+        pubsub.publish(f'user-{notification.user_id}', {
+            'type': 'notification',
+            'id': notification.id,
+            'content': notification.content,
+            'time': notification.timestamp.strftime('%B %d, %Y at %H:%M'),
+            'category': notification.type
+        })
+
+    return len(claimed)
+
+def publish_appointment_update(appointment, owner_id):
+    # Tell the customer's and the owner's open dashboards that an appointment changed
+    event = {
+        'type': 'appointment',
+        'appointment_id': appointment.id,
+        'salon_id': appointment.salon_id,
+        'status': appointment.status,
+        'payment_status': appointment.payment_status
+    }
+    pubsub.publish(f'user-{appointment.customer_id}', event)
+    pubsub.publish(f'user-{owner_id}', event)
+    bump_user_version(appointment.customer_id, owner_id)
 
-def get_date_slots(salon_id):
-    slots = TimeSlot.query.filter_by(
+outbox_worker = OutboxWorker()
+
+
+def get_available_dates(salon_id):
+    # Dates in the booking window that still have at least one free slot
+    today = datetime.now().date()
+    dates = db.session.query(TimeSlot.date).filter(
+        TimeSlot.salon_id == salon_id,
+        TimeSlot.is_available == True,
+        TimeSlot.date >= today,
+        TimeSlot.date <= today + timedelta(days=current_app.config['BOOKING_WINDOW_DAYS'])
+    ).distinct().order_by(TimeSlot.date)
+
+    return [{
+        'date_str': day.strftime('%Y-%m-%d'),
+        'day_name': day.strftime('%A')
+    } for (day,) in dates]
+
+def to_minutes(value):
+    return value.hour * 60 + value.minute
+
+def from_minutes(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+# Free intervals per (salon_id, date), shared by every service of the salon
+availability_cache = {}
+availability_cache_lock = threading.Lock()
+
+def get_free_intervals(salon_id, day):
+    key = (salon_id, day)
+    cached = availability_cache.get(key)
+    if cached and cached[0] > monotonic():
+        return cached[1]
+
+    # Merge touching or overlapping available slots into continuous intervals
+    intervals = []
+    for start_time, end_time in db.session.query(
+        TimeSlot.start_time, TimeSlot.end_time
+    ).filter_by(
         salon_id=salon_id,
+        date=day,
         is_available=True
+    ).order_by(TimeSlot.start_time):
+        start, end = to_minutes(start_time), to_minutes(end_time)
+        if intervals and start <= intervals[-1][1]:
+            intervals[-1][1] = max(intervals[-1][1], end)
+        else:
+            intervals.append([start, end])
+
+    # Cut out every open appointment for the time it reserved
+    for appointment_time, appointment_end in db.session.query(
+        Appointment.time, Appointment.end_time
     ).filter(
-        TimeSlot.date >= datetime.now().date()
+        Appointment.salon_id == salon_id,
+        Appointment.date == day,
+        Appointment.status.in_(['pending', 'confirmed'])
+    ):
+        booked_start = to_minutes(appointment_time)
+        booked_end = to_minutes(appointment_end) if appointment_end is not None else 24 * 60
+        remaining = []
+        for start, end in intervals:
+            if booked_end <= start or booked_start >= end:
+                remaining.append([start, end])
+                continue
+            if start < booked_start:
+                remaining.append([start, booked_start])
+            if booked_end < end:
+                remaining.append([booked_end, end])
+        intervals = remaining
+
+    intervals = [tuple(interval) for interval in intervals]
+
+    with availability_cache_lock:
+        if len(availability_cache) >= current_app.config['AVAILABILITY_CACHE_SIZE']:
+            availability_cache.pop(next(iter(availability_cache)), None)
+        availability_cache[key] = (monotonic() + current_app.config['AVAILABILITY_CACHE_TTL'], intervals)
+
+    return intervals
+
+def invalidate_availability(salon_id, day=None):
+    # Call after the commit that changed slots or appointments
+    with availability_cache_lock:
+        for key in [key for key in availability_cache if key[0] == salon_id and (day is None or key[1] == day)]:
+            availability_cache.pop(key, None)
+
+def get_available_start_times(salon_id, day, duration):
+    # Every start time at which a service of this duration fits in one free interval
+    step = current_app.config['AVAILABILITY_STEP_MINUTES']
+    now = datetime.now()
+    earliest = to_minutes(now) + 1 if day == now.date() else 0
+
+    start_times = []
+    for start, end in get_free_intervals(salon_id, day):
+        minute = start
+        while minute + duration <= end:
+            if minute >= earliest:
+                start_times.append(minute)
+            minute += step
+
+    return start_times
+
+def init_search_index():
+    # Full-text index over salon name, location, description and service names (SQLite FTS5)
+    if db.engine.dialect.name != 'sqlite':
+        return False
+
+    try:
+        if not db.inspect(db.engine).has_table('salon_search'):
+            with db.engine.begin() as connection:
+                connection.execute(db.text(
+                    "CREATE VIRTUAL TABLE salon_search USING fts5("
+                    "name, location, description, services, "
+                    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+                ))
+                # Rank by bm25 with name and location weighted above description
+                connection.execute(db.text(
+                    "INSERT INTO salon_search(salon_search, rank) VALUES ('rank', 'bm25(10.0, 5.0, 1.0, 3.0)')"
+                ))
+                connection.execute(db.text(
+                    "INSERT INTO salon_search(rowid, name, location, description, services) "
+                    "SELECT salon.id, salon.name, salon.location, salon.description, "
+                    "(SELECT group_concat(service.name, ' ') FROM service WHERE service.salon_id = salon.id) "
+                    "FROM salon"
+                ))
+        return True
+    except Exception as e:
+        current_app.logger.warning(f"Full-text search unavailable, falling back to LIKE: {str(e)}")
+        return False
+
+def full_text_search_enabled():
+    # Detected on first use rather than at startup, so creating the app never touches the database
+    enabled = current_app.config.get('FULL_TEXT_SEARCH')
+    if enabled is None:
+        enabled = db.engine.dialect.name == 'sqlite' and db.inspect(db.engine).has_table('salon_search')
+        current_app.config['FULL_TEXT_SEARCH'] = enabled
+    return enabled
+
+def index_salon(salon_id):
+    # Refresh a salon's search row inside the caller's transaction
+    if not full_text_search_enabled():
+        return
+
+    salon = db.session.get(Salon, salon_id)
+    service_names = [name for (name,) in db.session.query(Service.name).filter_by(salon_id=salon_id)]
+
+    db.session.execute(db.text("DELETE FROM salon_search WHERE rowid = :salon_id"), {'salon_id': salon_id})
+    if salon:
+        db.session.execute(
+            db.text(
+                "INSERT INTO salon_search(rowid, name, location, description, services) "
+                "VALUES (:salon_id, :name, :location, :description, :services)"
+            ),
+            {
+                'salon_id': salon.id,
+                'name': salon.name,
+                'location': salon.location,
+                'description': salon.description or '',
+                'services': ' '.join(service_names)
+            }
+        )
+
+def build_search_match(search_query):
+    # Quote every word so user input can never be parsed as FTS5 query syntax
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', search_query))
+
+def reserve_timeslot(timeslot_id):
+    # Compare-and-set on availability: of any number of concurrent requests for the
+    # same slot, exactly one sees a row updated, the rest learn the slot was just taken
+    result = db.session.execute(
+        db.update(TimeSlot).where(
+            TimeSlot.id == timeslot_id,
+            TimeSlot.is_available == True
+        ).values(
+            is_available=False
+        ).execution_options(
+            synchronize_session=False
+        )
+    )
+    return result.rowcount == 1
+
+def generate_schedule(salon, start_date, weeks, slot_minutes):
+    # Slot rows from opening to closing time on every open day, skipping anything
+    # that overlaps a slot the salon already has
+    opening_time = datetime.strptime(salon.opening_time, '%H:%M').time()
+    closing_time = datetime.strptime(salon.closing_time, '%H:%M').time()
+    end_date = start_date + timedelta(weeks=weeks)
+    slot_length = timedelta(minutes=slot_minutes)
+
+    # Load existing slots for the whole range once and check overlaps in memory
+    existing_slots = {}
+    for slot_date, slot_start, slot_end in db.session.query(
+        TimeSlot.date, TimeSlot.start_time, TimeSlot.end_time
+    ).filter(
+        TimeSlot.salon_id == salon.id,
+        TimeSlot.date >= start_date,
+        TimeSlot.date < end_date
+    ):
+        existing_slots.setdefault(slot_date, []).append((slot_start, slot_end))
+
+    now = datetime.now()
+    rows = []
+    day = start_date
+    while day < end_date:
+        if day.strftime('%A') != salon.weekly_closing:
+            taken = existing_slots.get(day, [])
+            start = datetime.combine(day, opening_time)
+            closing = datetime.combine(day, closing_time)
+
+            while start + slot_length <= closing:
+                end = start + slot_length
+                overlaps = any(
+                    taken_start < end.time() and taken_end > start.time()
+                    for taken_start, taken_end in taken
+                )
+                if start > now and not overlaps:
+                    rows.append({
+                        'salon_id': salon.id,
+                        'date': day,
+                        'start_time': start.time(),
+                        'end_time': end.time(),
+                        'is_available': True
+                    })
+                start = end
+        day += timedelta(days=1)
+
+    return rows
+
+def reserve_timeslots(salon_id, day, start_minutes, duration):
+    # Reserve every slot the appointment covers; False if any of them is taken or the
+    # slots leave a gap. The caller rolls back on False, undoing any slots already reserved
+    end_minutes = start_minutes + duration
+    if end_minutes > 24 * 60:
+        return False
+    start_time = datetime.strptime(from_minutes(start_minutes), '%H:%M').time()
+
+    # Every overlapping slot, taken or not, so a taken one rejects the booking
+    covering = db.session.query(
+        TimeSlot.id, TimeSlot.start_time, TimeSlot.end_time, TimeSlot.is_available
+    ).filter(
+        TimeSlot.salon_id == salon_id,
+        TimeSlot.date == day,
+        TimeSlot.end_time > start_time
+    )
+    if end_minutes < 24 * 60:
+        covering = covering.filter(TimeSlot.start_time < datetime.strptime(from_minutes(end_minutes), '%H:%M').time())
+
+    slot_ids = []
+    covered_until = start_minutes
+    for slot_id, slot_start, slot_end, is_available in covering.order_by(TimeSlot.start_time):
+        if not is_available or to_minutes(slot_start) > covered_until:
+            return False
+        covered_until = max(covered_until, to_minutes(slot_end))
+        slot_ids.append(slot_id)
+    if covered_until < end_minutes:
+        return False
+
+    return all(reserve_timeslot(slot_id) for slot_id in slot_ids)
+
+def end_time_after(start_minutes, duration):
+    # The time an appointment's reservation ends, or None if it runs to midnight
+    end_minutes = start_minutes + duration
+    if end_minutes >= 24 * 60:
+        return None
+    return datetime.strptime(from_minutes(end_minutes), '%H:%M').time()
+
+def release_timeslots(salon_id, day, start_time, end_time):
+    # Free exactly the slots reserve_timeslots took for [start_time, end_time)
+    released = TimeSlot.query.filter(
+        TimeSlot.salon_id == salon_id,
+        TimeSlot.date == day,
+        TimeSlot.end_time > start_time
+    )
+    if end_time is not None:
+        released = released.filter(TimeSlot.start_time < end_time)
+    released.update({TimeSlot.is_available: True}, synchronize_session=False)
+
+def bump_salon_version(salon_id):
+    # Expire cached public pages for this salon and the salon listings
+    page_cache.bump(f'salon-{salon_id}', 'salons')
+
+def bump_user_version(*user_ids):
+    # Expire ETags of pages showing these users' own data (dashboards, profile)
+    page_cache.bump(*[f'user-{user_id}' for user_id in user_ids])
+
+def bump_identity_version(*user_ids):
+    # Expire load_user's cached snapshots after a change to the user row itself
+    page_cache.bump(*[f'identity-{user_id}' for user_id in user_ids])
+
+def dashboard_scopes():
+    # Dashboards list the user's salons by name and split appointments on today's date
+    return ['salons', f"day-{datetime.now().date().isoformat()}"]
+
+def get_dashboard_appointments(salon_id):
+    # One query for every open appointment, customer and service joined in
+    appointments = Appointment.query.options(
+        joinedload(Appointment.customer),
+        joinedload(Appointment.service)
+    ).filter(
+        Appointment.salon_id == salon_id,
+        Appointment.status.in_(['pending', 'confirmed'])
     ).order_by(
-        TimeSlot.date,
-        TimeSlot.start_time
+        Appointment.date,
+        Appointment.time
     ).all()
 
-    date_slots = {}
-    for slot in slots:
-        date_str = slot.date.strftime('%Y-%m-%d')
-        time_entry = {
-            'time': slot.start_time.strftime('%H:%M'),
-            'end': slot.end_time.strftime('%H:%M')  # Changed from 'end_time' to 'end'
+    grouped = {'pending': [], 'confirmed': []}
+    for appointment in appointments:
+        grouped[appointment.status].append(appointment)
+
+    return grouped
+
+def customer_appointments_query(customer_id):
+    return Appointment.query.options(
+        joinedload(Appointment.salon),
+        joinedload(Appointment.service)
+    ).filter(
+        Appointment.customer_id == customer_id
+    )
+
+def get_customer_appointments(customer_id, today, before=None, limit=None):
+    # Upcoming appointments in full, past ones one page at a time (keyset on date, time and id);
+    # both are split and ordered by the (customer_id, date, time) index
+    upcoming = customer_appointments_query(customer_id).filter(
+        Appointment.date >= today
+    ).order_by(
+        Appointment.date.desc(),
+        Appointment.time.desc()
+    ).all()
+
+    past_query = customer_appointments_query(customer_id).filter(Appointment.date < today)
+    if before:
+        past_query = past_query.filter(
+            db.tuple_(Appointment.date, Appointment.time, Appointment.id) < (before['date'], before['time'], before['id'])
+        )
+
+    limit = limit or current_app.config['PAST_APPOINTMENTS_PER_PAGE']
+    past = past_query.order_by(
+        Appointment.date.desc(),
+        Appointment.time.desc(),
+        Appointment.id.desc()
+    ).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(past) > limit:
+        past = past[:limit]
+        last = past[-1]
+        next_cursor = {
+            'before': last.id,
+            'before_date': last.date.isoformat(),
+            'before_time': last.time.strftime('%H:%M:%S')
         }
-        
-        if date_str not in date_slots:
-            date_slots[date_str] = {
-                'date_str': date_str,
-                'day_name': slot.date.strftime('%A'),
-                'times': []
-            }
-        date_slots[date_str]['times'].append(time_entry)
-    
-    return list(date_slots.values())
+
+    return upcoming, past, next_cursor
+
+def get_unread_notifications(user_id):
+    return Notification.query.filter_by(
+        user_id=user_id,
+        is_read=False
+    ).order_by(
+        Notification.timestamp.desc()
+    ).all()
+
+def get_salon_reviews(salon_id, before=None, limit=None):
+    # Newest reviews first, one page at a time (keyset on date posted and id)
+    reviews_query = Review.query.options(
+        joinedload(Review.customer)
+    ).filter_by(
+        salon_id=salon_id
+    )
+    if before:
+        reviews_query = reviews_query.filter(
+            db.or_(
+                Review.date_posted < before['date_posted'],
+                db.and_(Review.date_posted == before['date_posted'], Review.id < before['id'])
+            )
+        )
+
+    limit = limit or current_app.config['REVIEWS_PER_PAGE']
+    reviews = reviews_query.order_by(
+        Review.date_posted.desc(),
+        Review.id.desc()
+    ).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(reviews) > limit:
+        reviews = reviews[:limit]
+        next_cursor = {'before': reviews[-1].id, 'before_date': reviews[-1].date_posted.isoformat()}
+
+    return reviews, next_cursor
+
+def get_salon_earnings(salon_id):
+    # Sum completed service prices per month in SQL instead of loading every appointment
+    year = db.extract('year', Appointment.date)
+    month = db.extract('month', Appointment.date)
+    rows = db.session.query(
+        year, month, db.func.sum(Service.price)
+    ).join(
+        Service, Appointment.service_id == Service.id
+    ).filter(
+        Appointment.salon_id == salon_id,
+        Appointment.status == 'completed'
+    ).group_by(year, month).order_by(year, month).all()
+
+    earnings_history = {}
+    for row_year, row_month, total in rows:
+        earnings_history[f"{int(row_year)}-{int(row_month)}"] = total or 0
+
+    return earnings_history
+
+def get_service_types():
+    # Distinct service names for the filter dropdown. Each step seeks the next name in
+    # ix_service_name_salon (a loose index scan), so the cost follows the number of
+    # names rather than the number of services
+    names = db.select(db.func.min(Service.name).label('name')).cte('service_names', recursive=True)
+    following = db.select(db.func.min(Service.name)).where(Service.name > names.c.name).scalar_subquery()
+    names = names.union_all(db.select(following).where(names.c.name.isnot(None)))
+    return [name for (name,) in db.session.execute(
+        db.select(names.c.name).where(names.c.name.isnot(None)).order_by(names.c.name)
+    )]
+
+def get_salon_listing(search_query='', service_type='', after_id=None, after_rank=None, limit=None):
+    limit = limit or current_app.config['SALONS_PER_PAGE']
+
+    # Per-salon aggregates as correlated subqueries, so the listing is a single statement;
+    # ratings come from the counters kept on Salon itself
+    min_price = db.select(db.func.min(Service.price)).where(
+        Service.salon_id == Salon.id
+    ).correlate(Salon).scalar_subquery()
+    cover_image = db.select(SalonImage.image_path).where(
+        SalonImage.salon_id == Salon.id
+    ).correlate(Salon).order_by(SalonImage.id).limit(1).scalar_subquery()
+
+    # Only free text is ranked; a service type alone is a plain filter
+    match = build_search_match(search_query) if full_text_search_enabled() else ''
+
+    # Service types are exact names from the dropdown, so one seek in ix_service_name_salon
+    offers_service = db.exists().where(
+        Service.name == service_type,
+        Service.salon_id == Salon.id
+    )
+
+    if match:
+        # Ranked full-text hits; keyset pagination runs over (rank, salon id)
+        search = db.table('salon_search', db.column('rowid'), db.column('rank'))
+        hits = db.select(
+            search.c.rowid.label('salon_id'),
+            search.c.rank.label('rank')
+        ).where(
+            db.literal_column('salon_search').op('MATCH')(match)
+        ).subquery()
+        rank = hits.c.rank
+    else:
+        rank = db.literal(None)
+
+    query = db.session.query(
+        Salon,
+        min_price.label('min_price'),
+        cover_image.label('cover_image'),
+        rank.label('rank')
+    )
+
+    if match:
+        query = query.join(hits, hits.c.salon_id == Salon.id)
+        if service_type:
+            query = query.filter(offers_service)
+        if after_id and after_rank is not None:
+            query = query.filter(
+                db.or_(
+                    hits.c.rank > after_rank,
+                    db.and_(hits.c.rank == after_rank, Salon.id > after_id)
+                )
+            )
+        query = query.order_by(hits.c.rank, Salon.id)
+    else:
+        # Apply search filter if search query exists
+        if search_query:
+            query = query.filter(
+                db.or_(
+                    Salon.name.ilike(f'%{search_query}%'),
+                    Salon.location.ilike(f'%{search_query}%')
+                )
+            )
+
+        if service_type and not search_query:
+            # Walk the salons offering the service in id order straight off the index,
+            # stopping at the page size, however common or rare the service is
+            offering = db.select(Service.salon_id).where(Service.name == service_type)
+            if after_id:
+                offering = offering.where(Service.salon_id > after_id)
+            offering = offering.distinct().order_by(Service.salon_id).limit(limit + 1).subquery()
+            query = query.join(offering, offering.c.salon_id == Salon.id)
+        elif service_type:
+            query = query.filter(offers_service)
+
+        # Keyset pagination: continue after the last salon id of the previous page. The first
+        # page is bounded too, so every page is a rowid range search that stops at the limit
+        query = query.filter(Salon.id > (after_id or 0)).order_by(Salon.id)
+
+    rows = query.limit(limit + 1).all()
+
+    salons = []
+    for salon, salon_min_price, salon_cover, salon_rank in rows[:limit]:
+        salon.min_price = salon_min_price
+        salon.cover_image = salon_cover
+        salon.search_rank = salon_rank
+        salons.append(salon)
+
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = {'after': salons[-1].id}
+        if match:
+            next_cursor['after_rank'] = repr(salons[-1].search_rank)
+
+    return salons, next_cursor
+
+def get_featured_salons(count=None):
+    # Random salons without sorting the whole table: draw ids between the smallest and
+    # largest and fetch them by primary key; ids of deleted salons just mean another draw
+    count = count or current_app.config['FEATURED_SALONS']
+    # Separate subqueries, because SQLite only reads min or max straight off the
+    # primary key when the aggregate is alone in its SELECT
+    low, high = db.session.query(
+        db.select(db.func.min(Salon.id)).scalar_subquery(),
+        db.select(db.func.max(Salon.id)).scalar_subquery()
+    ).one()
+    if low is None:
+        return []
+
+    cover_image = db.select(SalonImage.image_path).where(
+        SalonImage.salon_id == Salon.id
+    ).correlate(Salon).order_by(SalonImage.id).limit(1).scalar_subquery()
+
+    featured = {}
+    span = high - low + 1
+    for attempt in range(5):
+        wanted = count - len(featured)
+        # A small id range is read whole; otherwise draw three ids per missing card
+        ids = range(low, high + 1) if span <= wanted * 3 else random.sample(range(low, high + 1), wanted * 3)
+
+        rows = db.session.query(Salon, cover_image.label('cover_image')).filter(
+            Salon.id.in_(list(ids)),
+            Salon.id.not_in(list(featured))
+        ).all()
+        random.shuffle(rows)
+        for salon, salon_cover in rows[:wanted]:
+            salon.cover_image = salon_cover
+            featured[salon.id] = salon
+
+        if span <= wanted * 3 or len(featured) >= count:
+            break
+
+    return list(featured.values())
+
+@main.before_app_request
+def start_background_workers():
+    outbox_worker.ensure_started()
+    image_variants.ensure_started()
+    sqlite_tuning.ensure_started()
 
 # Routes
-@app.route('/')
+@main.route('/')
+@read_replica.route
+@page_cache.cached(scopes=lambda: ['salons'], ttl=60)  # featured salons rotate every minute
 def index():
-    # Get random salons (0-3)
-    salon_count = Salon.query.count()
-    featured_count = min(6, salon_count)
-    featured_salons = Salon.query.order_by(db.func.random()).limit(featured_count).all()
+    featured_salons = get_featured_salons()
     
     return render_template('index.html', featured_salons=featured_salons)
 
-@app.route('/login', methods=['GET', 'POST'])
+@main.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         email = request.form.get('email')
@@ -217,20 +1067,31 @@ def login():
         
         user = User.query.filter_by(email=email).first()
         
-        if user and check_password_hash(user.password, password):
+        try:
+            valid = user is not None and password_hasher.verify(user.password, password)
+            if valid and password_hasher.needs_rehash(user.password):
+                # Stored with older hashing parameters; upgrade while we have the password
+                user.password = password_hasher.hash(password)
+                db.session.commit()
+                bump_identity_version(user.id)
+        except HashingBusy:
+            flash('We are handling a lot of sign-ins right now. Please try again in a moment.')
+            return render_template('login.html'), 503, {'Retry-After': '5'}
+        
+        if valid:
             login_user(user)
             
             # Redirect based on role
             if user.role == 'customer':
-                return redirect(url_for('customer_dashboard'))
+                return redirect(url_for('main.customer_dashboard'))
             else:
-                return redirect(url_for('salon_dashboard'))
+                return redirect(url_for('main.salon_dashboard'))
         else:
             flash('Invalid email or password.')
     
     return render_template('login.html')
 
-@app.route('/signup', methods=['GET', 'POST'])
+@main.route('/signup', methods=['GET', 'POST'])
 def signup():
     if request.method == 'POST':
         name = request.form.get('name')
@@ -242,10 +1103,14 @@ def signup():
         existing_user = User.query.filter_by(email=email).first()
         if existing_user:
             flash('Email already registered. Please log in.')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         
         # Create new user
-        hashed_password = generate_password_hash(password)
+        try:
+            hashed_password = password_hasher.hash(password)
+        except HashingBusy:
+            flash('We are handling a lot of sign-ups right now. Please try again in a moment.')
+            return render_template('signup.html'), 503, {'Retry-After': '5'}
         new_user = User(name=name, email=email, password=hashed_password, role=role)
         
         db.session.add(new_user)
@@ -260,110 +1125,100 @@ def signup():
                 description="Please add a description of your salon"
             )
             db.session.add(new_salon)
+            db.session.flush()
+            index_salon(new_salon.id)
             db.session.commit()
+            bump_salon_version(new_salon.id)
         
         flash('Account created successfully! Please log in.')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
     return render_template('signup.html')
 
-@app.route('/logout')
+@main.route('/logout')
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/customer/dashboard')
+@main.route('/customer/dashboard')
+@read_replica.route
 @login_required
+@page_cache.conditional(scopes=dashboard_scopes)
 def customer_dashboard():
     if current_user.role != 'customer':
         flash('Access denied.')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
-    # Get all appointments ordered by date (newest first) and time (newest first)
-    all_appointments = Appointment.query.filter_by(
-        customer_id=current_user.id
-    ).order_by(
-        Appointment.date.desc(),
-        Appointment.time.desc()
-    ).all()
+    # Past appointments are paged with a cursor from the previous page
+    before = None
+    try:
+        before_id = request.args.get('before', type=int)
+        if before_id:
+            before = {
+                'id': before_id,
+                'date': datetime.strptime(request.args.get('before_date', ''), '%Y-%m-%d').date(),
+                'time': datetime.strptime(request.args.get('before_time', ''), '%H:%M:%S').time()
+            }
+    except ValueError:
+        before = None
     
-    # Split into past and upcoming
-    past_appointments = [a for a in all_appointments if a.date < datetime.now().date()]
-    upcoming_appointments = [a for a in all_appointments if a.date >= datetime.now().date()]
+    upcoming_appointments, past_appointments, next_past = get_customer_appointments(
+        current_user.id, datetime.now().date(), before
+    )
     
     # Get notifications
-    notifications = Notification.query.filter_by(
-        user_id=current_user.id,
-        is_read=False
-    ).order_by(
-        Notification.timestamp.desc()
-    ).all()
+    notifications = get_unread_notifications(current_user.id)
     
     return render_template('customer_dashboard.html', 
                          past_appointments=past_appointments, 
                          upcoming_appointments=upcoming_appointments,
-                         notifications=notifications)
+                         notifications=notifications,
+                         next_past=next_past,
+                         past_paged=bool(before))
 
-@app.route('/salon/dashboard')
+@main.route('/salon/dashboard')
+@read_replica.route
 @login_required
+@page_cache.conditional(scopes=dashboard_scopes)
 def salon_dashboard():
     if current_user.role != 'salon_owner':
         flash('Access denied.')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     # Get salon info
-    salon = Salon.query.filter_by(owner_id=current_user.id).first()
+    salon = get_owner_salon()
     
     if not salon:
         flash('Salon information not found.')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
-    # Get appointments for the salon
-    pending_appointments = Appointment.query.filter_by(salon_id=salon.id, status='pending').all()
-    confirmed_appointments = Appointment.query.filter_by(salon_id=salon.id, status='confirmed').all()
+    # Get pending and confirmed appointments for the salon in a single query
+    appointments = get_dashboard_appointments(salon.id)
     
     # Get salon notifications
-    notifications = Notification.query.filter_by(user_id=current_user.id, is_read=False).order_by(Notification.timestamp.desc()).all()
+    notifications = get_unread_notifications(current_user.id)
     
     # Calculate earnings
-    current_month = datetime.now().month
-    current_year = datetime.now().year
-    
-    completed_appointments = Appointment.query.filter_by(
-        salon_id=salon.id, 
-        status='completed'
-    ).all()
-    
-    current_month_earnings = sum([
-        appt.service.price for appt in completed_appointments 
-        if appt.date.month == current_month and appt.date.year == current_year
-    ])
-    
-    # Group by month for history
-    earnings_history = {}
-    for appt in completed_appointments:
-        month_key = f"{appt.date.year}-{appt.date.month}"
-        if month_key not in earnings_history:
-            earnings_history[month_key] = 0
-        earnings_history[month_key] += appt.service.price
+    earnings_history = get_salon_earnings(salon.id)
+    current_month_earnings = earnings_history.get(f"{datetime.now().year}-{datetime.now().month}", 0)
     
     return render_template('salon_dashboard.html',
                           salon=salon,
-                          pending_appointments=pending_appointments,
-                          confirmed_appointments=confirmed_appointments,
+                          pending_appointments=appointments['pending'],
+                          confirmed_appointments=appointments['confirmed'],
                           notifications=notifications,
                           current_month_earnings=current_month_earnings,
                           earnings_history=earnings_history)
 
-@app.route('/salon/profile', methods=['GET', 'POST'])
+@main.route('/salon/profile', methods=['GET', 'POST'])
 @login_required
 def salon_profile():
     if current_user.role != 'salon_owner':
         flash('Access denied.')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
-    salon = Salon.query.filter_by(owner_id=current_user.id).first()
+    salon = get_owner_salon()
     
     if request.method == 'POST':
         salon.name = request.form.get('salon_name')
@@ -379,25 +1234,28 @@ def salon_profile():
             files = request.files.getlist('salon_images')
             for file in files:
                 if file and file.filename != '':
-                    image_path = save_image(file)
+                    image_path = save_image(file, scopes=(f'salon-{salon.id}', 'salons'))
                     if image_path:
                         new_image = SalonImage(salon_id=salon.id, image_path=image_path)
                         db.session.add(new_image)
         
+        index_salon(salon.id)
         db.session.commit()
+        bump_salon_version(salon.id)
+        bump_user_version(current_user.id)
         flash('Salon information updated successfully!')
-        return redirect(url_for('salon_dashboard'))
+        return redirect(url_for('main.salon_dashboard'))
     
     return render_template('salon_profile.html', salon=salon)
 
-@app.route('/salon/services', methods=['GET', 'POST'])
+@main.route('/salon/services', methods=['GET', 'POST'])
 @login_required
 def salon_services():
     if current_user.role != 'salon_owner':
         flash('Access denied.')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
-    salon = Salon.query.filter_by(owner_id=current_user.id).first()
+    salon = get_owner_salon()
     
     if request.method == 'POST':
         name = request.form.get('name')
@@ -414,21 +1272,23 @@ def salon_services():
         )
         
         db.session.add(new_service)
+        index_salon(salon.id)
         db.session.commit()
+        bump_salon_version(salon.id)
         flash('Service added successfully!')
-        return redirect(url_for('salon_services'))
+        return redirect(url_for('main.salon_services'))
     
     services = Service.query.filter_by(salon_id=salon.id).all()
     return render_template('salon_services.html', salon=salon, services=services)
 
-@app.route('/salon/employees', methods=['GET', 'POST'])
+@main.route('/salon/employees', methods=['GET', 'POST'])
 @login_required
 def salon_employees():
     if current_user.role != 'salon_owner':
         flash('Access denied.')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
-    salon = Salon.query.filter_by(owner_id=current_user.id).first()
+    salon = get_owner_salon()
     
     if request.method == 'POST':
         name = request.form.get('name')
@@ -448,24 +1308,22 @@ def salon_employees():
         db.session.add(new_employee)
         db.session.commit()
         flash('Employee added successfully!')
-        return redirect(url_for('salon_employees'))
+        return redirect(url_for('main.salon_employees'))
     
     employees = Employee.query.filter_by(salon_id=salon.id).all()
     return render_template('salon_employees.html', salon=salon, employees=employees)
 
-from datetime import datetime, timedelta  # Add this import at the top of your app.py
-
-@app.route('/salon/timeslots', methods=['GET', 'POST'])
+@main.route('/salon/timeslots', methods=['GET', 'POST'])
 @login_required
 def salon_timeslots():
     if current_user.role != 'salon_owner':
         flash('Access denied.', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
-    salon = Salon.query.filter_by(owner_id=current_user.id).first()
+    salon = get_owner_salon()
     if not salon:
         flash('Salon not found.', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     if request.method == 'POST':
         try:
@@ -476,7 +1334,7 @@ def salon_timeslots():
             
             if not all([date_str, start_str, end_str]):
                 flash('All fields are required.', 'error')
-                return redirect(url_for('salon_timeslots'))
+                return redirect(url_for('main.salon_timeslots'))
             
             # Parse and validate datetime
             date = datetime.strptime(date_str, '%Y-%m-%d').date()
@@ -485,11 +1343,11 @@ def salon_timeslots():
             
             if date < datetime.now().date():
                 flash("Can't add slots for past dates.", 'error')
-                return redirect(url_for('salon_timeslots'))
+                return redirect(url_for('main.salon_timeslots'))
                 
             if start_time >= end_time:
                 flash('End time must be after start time.', 'error')
-                return redirect(url_for('salon_timeslots'))
+                return redirect(url_for('main.salon_timeslots'))
                 
             # Check for overlapping slots
             overlapping = TimeSlot.query.filter_by(
@@ -502,7 +1360,7 @@ def salon_timeslots():
             
             if overlapping:
                 flash('This time slot overlaps with an existing one.', 'error')
-                return redirect(url_for('salon_timeslots'))
+                return redirect(url_for('main.salon_timeslots'))
             
             # Create new slot
             new_slot = TimeSlot(
@@ -515,6 +1373,8 @@ def salon_timeslots():
             
             db.session.add(new_slot)
             db.session.commit()
+            invalidate_availability(salon.id, date)
+            bump_salon_version(salon.id)
             flash('Time slot added successfully!', 'success')
             
         except ValueError as e:
@@ -523,9 +1383,9 @@ def salon_timeslots():
         except Exception as e:
             db.session.rollback()
             flash('An error occurred while adding the time slot.', 'error')
-            app.logger.error(f"Error in salon_timeslots: {str(e)}")
+            current_app.logger.error(f"Error in salon_timeslots: {str(e)}")
         
-        return redirect(url_for('salon_timeslots'))
+        return redirect(url_for('main.salon_timeslots'))
     
     # GET request handling
     try:
@@ -551,89 +1411,146 @@ def salon_timeslots():
         
     except Exception as e:
         flash('Error loading time slots.', 'error')
-        app.logger.error(f"Error loading timeslots: {str(e)}")
-        return redirect(url_for('salon_dashboard'))
+        current_app.logger.error(f"Error loading timeslots: {str(e)}")
+        return redirect(url_for('main.salon_dashboard'))
+
+@main.route('/salon/timeslots/generate', methods=['POST'])
+@login_required
+def generate_timeslots():
+    if current_user.role != 'salon_owner':
+        flash('Access denied.', 'error')
+        return redirect(url_for('main.index'))
+    
+    salon = get_owner_salon()
+    if not salon:
+        flash('Salon not found.', 'error')
+        return redirect(url_for('main.index'))
+    
+    if not salon.opening_time or not salon.closing_time:
+        flash('Set your opening and closing times in the salon profile first.', 'error')
+        return redirect(url_for('main.salon_timeslots'))
+    
+    try:
+        start_date = datetime.strptime(request.form.get('start_date', ''), '%Y-%m-%d').date()
+        weeks = int(request.form.get('weeks', 1))
+        slot_minutes = int(request.form.get('slot_length', 30))
+        
+        if start_date < datetime.now().date():
+            flash("Can't add slots for past dates.", 'error')
+            return redirect(url_for('main.salon_timeslots'))
+        
+        if not 1 <= weeks <= current_app.config['MAX_SCHEDULE_WEEKS'] or not 15 <= slot_minutes <= 240:
+            flash('Invalid schedule length or slot length.', 'error')
+            return redirect(url_for('main.salon_timeslots'))
+        
+        if salon.closing_time <= salon.opening_time:
+            flash('Closing time must be after opening time.', 'error')
+            return redirect(url_for('main.salon_timeslots'))
+        
+        rows = generate_schedule(salon, start_date, weeks, slot_minutes)
+        
+        # Insert the whole schedule in one statement
+        if rows:
+            db.session.execute(db.insert(TimeSlot), rows)
+            db.session.commit()
+            invalidate_availability(salon.id)
+            bump_salon_version(salon.id)
+        
+        flash(f'{len(rows)} time slots added successfully!', 'success')
+    
+    except ValueError:
+        db.session.rollback()
+        flash('Invalid date or time format.', 'error')
+    except Exception as e:
+        db.session.rollback()
+        flash('An error occurred while generating the schedule.', 'error')
+        current_app.logger.error(f"Error in generate_timeslots: {str(e)}")
+    
+    return redirect(url_for('main.salon_timeslots'))
 
-@app.route('/customer/profile', methods=['GET', 'POST'])
+@main.route('/customer/profile', methods=['GET', 'POST'])
 @login_required
 def customer_profile():
     if current_user.role != 'customer':
         flash('Access denied.')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     if request.method == 'POST':
+        renamed = current_user.name != request.form.get('name')
         current_user.name = request.form.get('name')
         
         if 'profile_picture' in request.files and request.files['profile_picture']:
             image_path = save_image(request.files['profile_picture'])
             if image_path:
+                release_upload(current_user.profile_picture)
                 current_user.profile_picture = image_path
         
         db.session.commit()
+        bump_user_version(current_user.id)
+        bump_identity_version(current_user.id)
+        if renamed:
+            # Salon pages show reviewer names
+            reviewed = db.session.query(Review.salon_id).filter_by(customer_id=current_user.id).distinct()
+            page_cache.bump(*[f'salon-{salon_id}' for salon_id, in reviewed])
         flash('Profile updated successfully!')
-        return redirect(url_for('customer_dashboard'))
+        return redirect(url_for('main.customer_dashboard'))
     
     return render_template('customer_profile.html')
 
-@app.route('/find-salons')
+@main.route('/find-salons')
+@read_replica.route
+@page_cache.cached(scopes=lambda: ['salons'])
 def find_salons():
     search_query = request.args.get('search', '').strip()
     service_type = request.args.get('service_type', '').strip()
     
-    query = Salon.query
-    
-    # Apply search filter if search query exists
-    if search_query:
-        query = query.filter(
-            db.or_(
-                Salon.name.ilike(f'%{search_query}%'),
-                Salon.location.ilike(f'%{search_query}%')
-            )
-        )
+    after_id = request.args.get('after', type=int)
+    after_rank = request.args.get('after_rank', type=float)
     
-    # Apply service type filter if selected
-    if service_type:
-        query = query.join(Service).filter(Service.name.ilike(f'%{service_type}%'))
+    salons, next_cursor = get_salon_listing(search_query, service_type, after_id, after_rank)
     
-    salons = query.all()
-    
-    # Get unique service types for dropdown
-    service_types = [s.name for s in Service.query.distinct(Service.name).all()]
-    
-    # Get minimum price for each salon
-    for salon in salons:
-        min_price_service = Service.query.filter_by(salon_id=salon.id).order_by(Service.price).first()
-        salon.min_price = min_price_service.price if min_price_service else 0
+    service_types = get_service_types()
     
     return render_template('find_salons.html', 
                          salons=salons,
-                         service_types=service_types)
+                         service_types=service_types,
+                         next_cursor=next_cursor,
+                         after_id=after_id)
 
-@app.route('/salon/<int:salon_id>')
+@main.route('/salon/<int:salon_id>')
+@read_replica.route
+@page_cache.cached(scopes=lambda salon_id: [f'salon-{salon_id}'])
 def salon_detail(salon_id):
     salon = Salon.query.get_or_404(salon_id)
     services = Service.query.filter_by(salon_id=salon_id).all()
-    reviews = Review.query.filter_by(salon_id=salon_id).order_by(Review.date_posted.desc()).all()
     
-    # Calculate average rating
-    if reviews:
-        avg_rating = sum([review.rating for review in reviews]) / len(reviews)
-    else:
-        avg_rating = 0
+    # Reviews are paged with a cursor from the previous page
+    before = None
+    before_id = request.args.get('before', type=int)
+    before_date = request.args.get('before_date')
+    if before_id and before_date:
+        try:
+            before = {'id': before_id, 'date_posted': datetime.fromisoformat(before_date)}
+        except ValueError:
+            before_id = None
+    
+    reviews, next_reviews = get_salon_reviews(salon_id, before)
     
     return render_template('salon_detail.html', 
                           salon=salon, 
                           services=services, 
                           reviews=reviews, 
-                          avg_rating=avg_rating)
+                          avg_rating=salon.average_rating,
+                          next_reviews=next_reviews,
+                          reviews_paged=bool(before_id))
 
 
-@app.route('/salon/<int:salon_id>/book', methods=['GET', 'POST'])
+@main.route('/salon/<int:salon_id>/book', methods=['GET', 'POST'])
 @login_required
 def book_appointment(salon_id):
     if current_user.role != 'customer':
         flash('Only customers can book appointments.')
-        return redirect(url_for('salon_detail', salon_id=salon_id))
+        return redirect(url_for('main.salon_detail', salon_id=salon_id))
     
     salon = Salon.query.get_or_404(salon_id)
     
@@ -642,7 +1559,7 @@ def book_appointment(salon_id):
         services = Service.query.filter_by(salon_id=salon_id).all()
         if not services:
             flash('This salon currently has no services available.')
-            return redirect(url_for('salon_detail', salon_id=salon_id))
+            return redirect(url_for('main.salon_detail', salon_id=salon_id))
         
         if request.method == 'POST':
             # Validate form data
@@ -653,37 +1570,33 @@ def book_appointment(salon_id):
             
             if not all([service_id, date_str, time_str]):
                 flash('Please fill all required fields.')
-                return redirect(url_for('book_appointment', salon_id=salon_id))
+                return redirect(url_for('main.book_appointment', salon_id=salon_id))
             
             try:
                 date = datetime.strptime(date_str, '%Y-%m-%d').date()
                 time = datetime.strptime(time_str, '%H:%M').time()
             except ValueError:
                 flash('Invalid date or time format.')
-                return redirect(url_for('book_appointment', salon_id=salon_id))
+                return redirect(url_for('main.book_appointment', salon_id=salon_id))
             
             # Check if service exists
             service = Service.query.get(service_id)
             if not service or service.salon_id != salon_id:
                 flash('Invalid service selection.')
-                return redirect(url_for('book_appointment', salon_id=salon_id))
+                return redirect(url_for('main.book_appointment', salon_id=salon_id))
             
-            # Check time slot availability
-            timeslot = TimeSlot.query.filter_by(
-                salon_id=salon_id,
-                date=date,
-                is_available=True
-            ).filter(
-                TimeSlot.start_time <= time,
-                TimeSlot.end_time >= time
-            ).first()
-
-            if not timeslot:
+            # Check that the whole service fits into free time on that day
+            start_minutes = to_minutes(time)
+            if start_minutes not in get_available_start_times(salon_id, date, service.duration):
                 flash('Selected time slot is not available.')
-                return redirect(url_for('book_appointment', salon_id=salon_id))
+                return redirect(url_for('main.book_appointment', salon_id=salon_id))
             
-            # Mark timeslot as booked
-            timeslot.is_available = False
+            # Mark the covered timeslots as booked, unless another customer got there first
+            if not reserve_timeslots(salon_id, date, start_minutes, service.duration):
+                db.session.rollback()
+                invalidate_availability(salon_id, date)
+                flash('Sorry, this time slot was just taken by another customer. Please choose another time.')
+                return redirect(url_for('main.book_appointment', salon_id=salon_id))
             
             # Calculate discounted price if deposit payment is selected
             discounted_price = service.price * 0.95 if pay_deposit else 0
@@ -695,6 +1608,7 @@ def book_appointment(salon_id):
                 service_id=service_id,
                 date=date,
                 time=time,
+                end_time=end_time_after(start_minutes, service.duration),
                 status='pending',
                 # New fields for payment
                 has_paid_deposit=False,  # Will be set to True after payment
@@ -703,7 +1617,7 @@ def book_appointment(salon_id):
             )
             
             db.session.add(new_appointment)
-            db.session.commit()  # Need to commit to get appointment ID
+            db.session.flush()  # Need the appointment ID for the notification
             
             # Create notification for salon owner
             create_notification(
@@ -713,15 +1627,21 @@ def book_appointment(salon_id):
                 related_id=new_appointment.id
             )
             
+            # Slot, appointment and notification commit together
+            db.session.commit()
+            outbox_worker.notify()
+            invalidate_availability(salon_id, date)
+            publish_appointment_update(new_appointment, salon.owner_id)
+            
             # Redirect to payment gateway if deposit payment is selected
             if pay_deposit:
-                return redirect(url_for('payment_gateway', appointment_id=new_appointment.id))
+                return redirect(url_for('main.payment_gateway', appointment_id=new_appointment.id))
             else:
                 flash('Appointment booked successfully! Waiting for salon confirmation.')
-                return redirect(url_for('customer_dashboard'))
+                return redirect(url_for('main.customer_dashboard'))
         
-        # Prepare available time slots in JSON-serializable format
-        date_slots = get_date_slots(salon_id)
+        # Only the bookable dates; times are fetched per date from salon_availability
+        date_slots = get_available_dates(salon_id)
         if not date_slots:
             flash('No available time slots found for this salon.')
         
@@ -745,26 +1665,46 @@ def book_appointment(salon_id):
     except Exception as e:
         db.session.rollback()
         flash('An error occurred while processing your request.')
-        app.logger.error(f"Error in book_appointment: {str(e)}")
-        return redirect(url_for('salon_detail', salon_id=salon_id))
+        current_app.logger.error(f"Error in book_appointment: {str(e)}")
+        return redirect(url_for('main.salon_detail', salon_id=salon_id))
 
 
-@app.route('/appointment/<int:appointment_id>/confirm', methods=['POST'])
+@main.route('/salon/<int:salon_id>/availability')
+def salon_availability(salon_id):
+    service = Service.query.filter_by(id=request.args.get('service_id', type=int), salon_id=salon_id).first()
+    if not service:
+        return jsonify({'success': False, 'message': 'Invalid service selection'}), 400
+    
+    try:
+        day = datetime.strptime(request.args.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date format'}), 400
+    
+    if day < datetime.now().date():
+        return jsonify({'success': True, 'date': day.strftime('%Y-%m-%d'), 'times': []})
+    
+    times = [{
+        'time': from_minutes(start),
+        'end': from_minutes(start + service.duration)
+    } for start in get_available_start_times(salon_id, day, service.duration)]
+    
+    return jsonify({'success': True, 'date': day.strftime('%Y-%m-%d'), 'times': times})
+
+@main.route('/appointment/<int:appointment_id>/confirm', methods=['POST'])
 @login_required
 def confirm_appointment(appointment_id):
     if current_user.role != 'salon_owner':
         flash('Access denied.')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     appointment = Appointment.query.get_or_404(appointment_id)
     salon = Salon.query.get(appointment.salon_id)
     
     if salon.owner_id != current_user.id:
         flash('Access denied.')
-        return redirect(url_for('salon_dashboard'))
+        return redirect(url_for('main.salon_dashboard'))
     
     appointment.status = 'confirmed'
-    db.session.commit()
     
     # Create notification for customer
     create_notification(
@@ -774,10 +1714,14 @@ def confirm_appointment(appointment_id):
         related_id=appointment_id
     )
     
+    db.session.commit()
+    outbox_worker.notify()
+    publish_appointment_update(appointment, salon.owner_id)
+    
     flash('Appointment confirmed successfully!')
-    return redirect(url_for('salon_dashboard'))
+    return redirect(url_for('main.salon_dashboard'))
 
-@app.route('/appointment/<int:appointment_id>/cancel', methods=['POST'])
+@main.route('/appointment/<int:appointment_id>/cancel', methods=['POST'])
 @login_required
 def cancel_appointment(appointment_id):
     appointment = Appointment.query.get_or_404(appointment_id)
@@ -785,67 +1729,79 @@ def cancel_appointment(appointment_id):
     # Check authorization
     if current_user.role == 'customer' and appointment.customer_id != current_user.id:
         flash('Access denied.')
-        return redirect(url_for('customer_dashboard'))
+        return redirect(url_for('main.customer_dashboard'))
     
     if current_user.role == 'salon_owner':
         salon = Salon.query.get(appointment.salon_id)
         if salon.owner_id != current_user.id:
             flash('Access denied.')
-            return redirect(url_for('salon_dashboard'))
+            return redirect(url_for('main.salon_dashboard'))
 
-    # Find and update the timeslot
-    timeslot = TimeSlot.query.filter_by(
-        salon_id=appointment.salon_id,
-        date=appointment.date,
-        start_time=appointment.time
-    ).first()
-    
-    if timeslot:
-        timeslot.is_available = True
-    
-    appointment.status = 'cancelled'
-    db.session.commit()
+    # Only an open appointment can be cancelled; a conditional update so that two
+    # cancellations, or a cancellation racing completion, release the slots at most once
+    cancelled = db.session.execute(
+        db.update(Appointment).where(
+            Appointment.id == appointment_id,
+            Appointment.status.in_(['pending', 'confirmed'])
+        ).values(
+            status='cancelled'
+        ).execution_options(
+            synchronize_session=False
+        )
+    )
+    if cancelled.rowcount != 1:
+        db.session.rollback()
+        flash('This appointment is no longer open and cannot be cancelled.')
+        return redirect(url_for('main.customer_dashboard' if current_user.role == 'customer' else 'main.salon_dashboard'))
+
+    # Release the timeslots the appointment reserved, whatever the service's duration is now
+    release_timeslots(appointment.salon_id, appointment.date, appointment.time, appointment.end_time)
     
     # Create notification for the other party
+    salon = Salon.query.get(appointment.salon_id)
     if current_user.role == 'customer':
         # Notify salon owner
-        salon = Salon.query.get(appointment.salon_id)
         create_notification(
             user_id=salon.owner_id,
             content=f"Appointment with {current_user.name} has been cancelled by the customer.",
             notification_type='appointment',
             related_id=appointment_id
         )
-        flash('Appointment cancelled successfully!')
-        return redirect(url_for('customer_dashboard'))
     else:
         # Notify customer
-        salon = Salon.query.get(appointment.salon_id)
         create_notification(
             user_id=appointment.customer_id,
             content=f"Your appointment at {salon.name} has been cancelled by the salon.",
             notification_type='appointment',
             related_id=appointment_id
         )
-        flash('Appointment cancelled successfully!')
-        return redirect(url_for('salon_dashboard'))
+    
+    db.session.commit()
+    outbox_worker.notify()
+    invalidate_availability(appointment.salon_id, appointment.date)
+    publish_appointment_update(appointment, salon.owner_id)
+    
+    flash('Appointment cancelled successfully!')
+    if current_user.role == 'customer':
+        return redirect(url_for('main.customer_dashboard'))
+    else:
+        return redirect(url_for('main.salon_dashboard'))
 
-@app.route('/appointment/<int:appointment_id>/complete', methods=['POST'])
+@main.route('/appointment/<int:appointment_id>/complete', methods=['POST'])
 @login_required
 def complete_appointment(appointment_id):
     if current_user.role != 'salon_owner':
         flash('Access denied.')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     appointment = Appointment.query.get_or_404(appointment_id)
     salon = Salon.query.get(appointment.salon_id)
     
     if salon.owner_id != current_user.id:
         flash('Access denied.')
-        return redirect(url_for('salon_dashboard'))
+        return redirect(url_for('main.salon_dashboard'))
     
     appointment.status = 'completed'
-    db.session.commit()
     
     # Create notification for customer
     create_notification(
@@ -855,32 +1811,36 @@ def complete_appointment(appointment_id):
         related_id=appointment_id
     )
     
+    db.session.commit()
+    outbox_worker.notify()
+    publish_appointment_update(appointment, salon.owner_id)
+    
     flash('Appointment marked as completed!')
-    return redirect(url_for('salon_dashboard'))
+    return redirect(url_for('main.salon_dashboard'))
 
-@app.route('/appointment/<int:appointment_id>/book-again', methods=['POST'])
+@main.route('/appointment/<int:appointment_id>/book-again', methods=['POST'])
 @login_required
 def book_again(appointment_id):
     if current_user.role != 'customer':
         flash('Access denied.')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     old_appointment = Appointment.query.get_or_404(appointment_id)
     if old_appointment.customer_id != current_user.id:
         flash('Access denied.')
-        return redirect(url_for('customer_dashboard'))
+        return redirect(url_for('main.customer_dashboard'))
     
     # Redirect to booking page with pre-filled data
-    return redirect(url_for('book_appointment', 
+    return redirect(url_for('main.book_appointment', 
                            salon_id=old_appointment.salon_id, 
                            service_id=old_appointment.service_id))
 
-@app.route('/salon/<int:salon_id>/review', methods=['POST'])
+@main.route('/salon/<int:salon_id>/review', methods=['POST'])
 @login_required
 def post_review(salon_id):
     if current_user.role != 'customer':
         flash('Only customers can post reviews.')
-        return redirect(url_for('salon_detail', salon_id=salon_id))
+        return redirect(url_for('main.salon_detail', salon_id=salon_id))
     
     rating = int(request.form.get('rating'))
     comment = request.form.get('comment')
@@ -894,7 +1854,7 @@ def post_review(salon_id):
     
     if not has_appointment:
         flash('You can only review salons after a completed appointment.')
-        return redirect(url_for('salon_detail', salon_id=salon_id))
+        return redirect(url_for('main.salon_detail', salon_id=salon_id))
     
     # Check if user has already reviewed this salon
     existing_review = Review.query.filter_by(
@@ -903,6 +1863,10 @@ def post_review(salon_id):
     ).first()
     
     if existing_review:
+        # Keep the salon's rating counters in step with the edit
+        rating_delta = rating - existing_review.rating
+        rating_count_delta = 0
+        
         # Update existing review
         existing_review.rating = rating
         existing_review.comment = comment
@@ -917,12 +1881,21 @@ def post_review(salon_id):
             comment=comment
         )
         db.session.add(new_review)
+        rating_delta = rating
+        rating_count_delta = 1
         flash('Review posted successfully!')
     
+    # Update the counters in SQL so concurrent reviews cannot overwrite each other
+    Salon.query.filter_by(id=salon_id).update({
+        Salon.rating_sum: Salon.rating_sum + rating_delta,
+        Salon.rating_count: Salon.rating_count + rating_count_delta
+    }, synchronize_session=False)
+    
     db.session.commit()
-    return redirect(url_for('salon_detail', salon_id=salon_id))
+    bump_salon_version(salon_id)
+    return redirect(url_for('main.salon_detail', salon_id=salon_id))
 
-@app.route('/send-message', methods=['POST'])
+@main.route('/send-message', methods=['POST'])
 @login_required
 def send_message():
     receiver_id = int(request.form.get('receiver_id'))
@@ -937,6 +1910,7 @@ def send_message():
     )
     
     db.session.add(new_message)
+    db.session.flush()  # Need the message ID for the notification
     
     # Create notification for receiver
     create_notification(
@@ -947,42 +1921,81 @@ def send_message():
     )
     
     db.session.commit()
+    outbox_worker.notify()
     flash('Message sent successfully!')
     
     # Redirect based on user role
     if current_user.role == 'customer':
-        return redirect(url_for('customer_dashboard'))
+        return redirect(url_for('main.customer_dashboard'))
     else:
-        return redirect(url_for('salon_dashboard'))
+        return redirect(url_for('main.salon_dashboard'))
+
+@main.route('/events')
+@login_required
+def event_stream():
+    # Server-sent events: new notifications and appointment changes for the current user
+    enabled = current_app.config['SSE_ENABLED']
+    if enabled is None:
+        enabled = request.environ.get('wsgi.multithread', False)
+    if not enabled:
+        # On a single-threaded worker every open dashboard would hold a whole worker;
+        # 204 tells EventSource to stop reconnecting, and pages still load fresh data
+        return Response(status=204)
+
+    topic = f'user-{current_user.id}'
+    subscriber = pubsub.subscribe(topic)
+    keepalive = current_app.config['SSE_KEEPALIVE_SECONDS']
+    max_duration = current_app.config['SSE_MAX_STREAM_SECONDS']
+    
+    def stream():
+        # Runs after the request context is gone, so it must not touch the database
+        deadline = monotonic() + max_duration
+        try:
+            yield "retry: 3000\n\n"
+            while monotonic() < deadline:
+                try:
+                    event = subscriber.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            pubsub.unsubscribe(topic, subscriber)
+    
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
-@app.route('/mark-notification-read/<int:notification_id>', methods=['POST'])
+@main.route('/mark-notification-read/<int:notification_id>', methods=['POST'])
 @login_required
 def mark_notification_read(notification_id):
     notification = Notification.query.get_or_404(notification_id)
     
     if notification.user_id != current_user.id:
         flash('Access denied.')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     notification.is_read = True
     db.session.commit()
+    bump_user_version(current_user.id)
     
     return jsonify({'success': True})
 
-@app.route('/services/<int:service_id>/update', methods=['POST'])
+@main.route('/services/<int:service_id>/update', methods=['POST'])
 @login_required
 def update_service(service_id):
     if current_user.role != 'salon_owner':
         flash('Access denied.', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     service = Service.query.get_or_404(service_id)
-    salon = Salon.query.filter_by(owner_id=current_user.id).first()
+    salon = get_owner_salon()
     
     # Verify service belongs to owner's salon
     if not salon or service.salon_id != salon.id:
         flash('Access denied.', 'error')
-        return redirect(url_for('salon_services'))
+        return redirect(url_for('main.salon_services'))
     
     try:
         service.name = request.form.get('name')
@@ -990,43 +2003,49 @@ def update_service(service_id):
         service.price = float(request.form.get('price'))
         service.duration = int(request.form.get('duration'))
         
+        index_salon(salon.id)
         db.session.commit()
+        bump_salon_version(salon.id)
+        # Drop cached availability along with the pages showing it
+        invalidate_availability(salon.id)
         flash('Service updated successfully!', 'success')
     except Exception as e:
         db.session.rollback()
         flash('Error updating service.', 'error')
-        app.logger.error(f"Error updating service: {str(e)}")
+        current_app.logger.error(f"Error updating service: {str(e)}")
     
-    return redirect(url_for('salon_services'))
+    return redirect(url_for('main.salon_services'))
 
-@app.route('/services/<int:service_id>/delete', methods=['POST'])
+@main.route('/services/<int:service_id>/delete', methods=['POST'])
 @login_required
 def delete_service(service_id):
     if current_user.role != 'salon_owner':
         flash('Access denied.', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     service = Service.query.get_or_404(service_id)
-    salon = Salon.query.filter_by(owner_id=current_user.id).first()
+    salon = get_owner_salon()
     
     # Verify service belongs to owner's salon
     if not salon or service.salon_id != salon.id:
         flash('Access denied.', 'error')
-        return redirect(url_for('salon_services'))
+        return redirect(url_for('main.salon_services'))
     
     try:
         db.session.delete(service)
+        index_salon(salon.id)
         db.session.commit()
+        bump_salon_version(salon.id)
         flash('Service deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
         flash('Error deleting service.', 'error')
-        app.logger.error(f"Error deleting service: {str(e)}")
+        current_app.logger.error(f"Error deleting service: {str(e)}")
     
-    return redirect(url_for('salon_services'))
+    return redirect(url_for('main.salon_services'))
 
 
-@app.route('/clear-all-notifications', methods=['POST'])
+@main.route('/clear-all-notifications', methods=['POST'])
 @login_required
 def clear_all_notifications():
     if current_user.role != 'salon_owner':
@@ -1034,18 +2053,19 @@ def clear_all_notifications():
     
     Notification.query.filter_by(user_id=current_user.id).delete()
     db.session.commit()
+    bump_user_version(current_user.id)
     
     return jsonify({'success': True})
 
 
-@app.route('/salon/timeslots/<int:timeslot_id>/delete', methods=['POST'])
+@main.route('/salon/timeslots/<int:timeslot_id>/delete', methods=['POST'])
 @login_required
 def delete_timeslot(timeslot_id):
     if current_user.role != 'salon_owner':
         return jsonify({'success': False, 'message': 'Access denied'})
     
     timeslot = TimeSlot.query.get_or_404(timeslot_id)
-    salon = Salon.query.filter_by(owner_id=current_user.id).first()
+    salon = get_owner_salon()
     
     if not salon or timeslot.salon_id != salon.id:
         return jsonify({'success': False, 'message': 'Access denied'})
@@ -1053,29 +2073,31 @@ def delete_timeslot(timeslot_id):
     try:
         db.session.delete(timeslot)
         db.session.commit()
+        invalidate_availability(salon.id, timeslot.date)
+        bump_salon_version(salon.id)
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
-        app.logger.error(f"Error deleting timeslot: {str(e)}")
+        current_app.logger.error(f"Error deleting timeslot: {str(e)}")
         return jsonify({'success': False, 'message': 'Error deleting timeslot'})
     
 
-@app.route('/payment/gateway/<int:appointment_id>', methods=['GET'])
+@main.route('/payment/gateway/<int:appointment_id>', methods=['GET'])
 @login_required
 def payment_gateway(appointment_id):
     if current_user.role != 'customer':
         flash('Access denied.')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     appointment = Appointment.query.get_or_404(appointment_id)
     
     if appointment.customer_id != current_user.id:
         flash('Access denied.')
-        return redirect(url_for('customer_dashboard'))
+        return redirect(url_for('main.customer_dashboard'))
     
     if appointment.has_paid_deposit:
         flash('Deposit already paid for this appointment.')
-        return redirect(url_for('customer_dashboard'))
+        return redirect(url_for('main.customer_dashboard'))
     
     service = Service.query.get(appointment.service_id)
     salon = Salon.query.get(appointment.salon_id)
@@ -1095,22 +2117,22 @@ def payment_gateway(appointment_id):
         discounted_price=discounted_price
     )
 
-@app.route('/payment/process/<int:appointment_id>', methods=['POST'])
+@main.route('/payment/process/<int:appointment_id>', methods=['POST'])
 @login_required
 def process_payment(appointment_id):
     if current_user.role != 'customer':
         flash('Access denied.')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     appointment = Appointment.query.get_or_404(appointment_id)
     
     if appointment.customer_id != current_user.id:
         flash('Access denied.')
-        return redirect(url_for('customer_dashboard'))
+        return redirect(url_for('main.customer_dashboard'))
     
     if appointment.has_paid_deposit:
         flash('Deposit already paid for this appointment.')
-        return redirect(url_for('customer_dashboard'))
+        return redirect(url_for('main.customer_dashboard'))
     
     service = Service.query.get(appointment.service_id)
     salon = Salon.query.get(appointment.salon_id)
@@ -1120,7 +2142,7 @@ def process_payment(appointment_id):
     
     if not payment_method or not transaction_id:
         flash('Please fill in all payment details.')
-        return redirect(url_for('payment_gateway', appointment_id=appointment_id))
+        return redirect(url_for('main.payment_gateway', appointment_id=appointment_id))
     
     # Calculate deposit amount (3% of service price)
     deposit_amount = round(service.price * 0.03, 2)
@@ -1136,8 +2158,6 @@ def process_payment(appointment_id):
     appointment.discounted_price = discounted_price
     appointment.transaction_id = transaction_id
     
-    db.session.commit()
-    
     # Create notification for salon owner
     create_notification(
         user_id=salon.owner_id,
@@ -1146,15 +2166,304 @@ def process_payment(appointment_id):
         related_id=appointment.id
     )
     
+    db.session.commit()
+    outbox_worker.notify()
+    publish_appointment_update(appointment, salon.owner_id)
+    
     flash('Payment successful! You will get 5% discount on your service.')
-    return redirect(url_for('customer_dashboard'))
+    return redirect(url_for('main.customer_dashboard'))
+
+
+# CLI commands
+def add_hot_query_rows():
+    # One row of everything the hot queries read, so no helper returns early on an empty
+    # table; the caller rolls them back. Returns the ids the queries are run with
+    owner = User(email='query-plans-owner@invalid', password='!', name='Owner', role='salon_owner')
+    customer = User(email='query-plans-customer@invalid', password='!', name='Customer', role='customer')
+    db.session.add_all([owner, customer])
+    db.session.flush()
+
+    salon = Salon(owner_id=owner.id, name='Query Plans', location='Nowhere')
+    db.session.add(salon)
+    db.session.flush()
+
+    day = datetime.now().date() + timedelta(days=1)
+    nine, ten, eleven, noon = (datetime.strptime(f'{hour}:00', '%H:%M').time() for hour in (9, 10, 11, 12))
+    service = Service(salon_id=salon.id, name='Query Plans Service', price=1, duration=60)
+    db.session.add_all([
+        service,
+        SalonImage(salon_id=salon.id, image_path='uploads/query-plans.png'),
+        TimeSlot(salon_id=salon.id, date=day, start_time=nine, end_time=ten, is_available=True),
+        Review(customer_id=customer.id, salon_id=salon.id, rating=5),
+        Notification(user_id=customer.id, content='Query plans', type='system')
+    ])
+    db.session.flush()
+
+    appointment = Appointment(customer_id=customer.id, salon_id=salon.id, service_id=service.id,
+                              date=day, time=eleven, end_time=noon, status='pending')
+    db.session.add(appointment)
+    db.session.flush()
+
+    return {'owner': owner.id, 'customer': customer.id, 'salon': salon.id, 'service': service.name,
+            'appointment': appointment.id, 'day': day, 'start': nine, 'end': ten}
 
+def hot_queries(ids):
+    # The helpers behind our busiest routes, called the way the routes call them
+    salon, day, today = ids['salon'], ids['day'], datetime.now().date()
+    return [
+        ('load_user', lambda: load_user(ids['owner'])),
+        ('get_available_dates', lambda: get_available_dates(salon)),
+        ('get_free_intervals', lambda: get_free_intervals(salon, day)),
+        ('reserve_timeslots', lambda: reserve_timeslots(salon, day, 9 * 60, 60)),
+        ('release_timeslots', lambda: release_timeslots(salon, day, ids['start'], ids['end'])),
+        ('get_dashboard_appointments', lambda: get_dashboard_appointments(salon)),
+        ('get_salon_earnings', lambda: get_salon_earnings(salon)),
+        ('get_customer_appointments', lambda: get_customer_appointments(
+            ids['customer'], today, {'date': today, 'time': datetime.min.time(), 'id': ids['appointment']})),
+        ('get_unread_notifications', lambda: get_unread_notifications(ids['customer'])),
+        ('get_salon_reviews', lambda: get_salon_reviews(salon, {'date_posted': datetime.now(), 'id': 1})),
+        ('get_featured_salons', get_featured_salons),
+        ('get_service_types', get_service_types),
+        ('get_salon_listing', get_salon_listing),
+        ('get_salon_listing next page', lambda: get_salon_listing(after_id=salon)),
+        ('get_salon_listing text', lambda: get_salon_listing(search_query='query plans')),
+        ('get_salon_listing text next page', lambda: get_salon_listing(
+            search_query='query plans', after_id=salon, after_rank=0.0)),
+        ('get_salon_listing service type', lambda: get_salon_listing(service_type=ids['service'])),
+        ('get_salon_listing text and service type', lambda: get_salon_listing(
+            search_query='query plans', service_type=ids['service'])),
+    ]
 
+def capture_statements(call):
+    # Run a helper and return the (statement, parameters) it sent to the database
+    statements = []
 
-# Create the database tables if they don't exist
-with app.app_context():
+    def record(connection, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters[0] if executemany else parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        call()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return statements
+
+def explain_query_plan(statement, parameters):
+    # Planned in the session's transaction, so it sees the same rows as the helper did
+    rows = db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    return [row[-1] for row in rows]
+
+def table_scans(plan):
+    # Steps reading a whole table or index. Subquery and CTE results, full-text
+    # virtual tables and SELECTs without a FROM are scanned by design
+    derived = {step.split()[1] for step in plan if step.startswith(('CO-ROUTINE ', 'MATERIALIZE '))}
+    return [
+        step for step in plan
+        if step.startswith('SCAN ')
+        and step != 'SCAN CONSTANT ROW'
+        and 'VIRTUAL TABLE' not in step
+        and step.split()[1] not in derived
+    ]
+
+def upgrade_database():
+    # Create missing tables, apply migrations and build the search index; returns the migrations applied
     db.create_all()
+    applied = migrations.upgrade(db.engine)
+    current_app.config['FULL_TEXT_SEARCH'] = init_search_index()
+    return applied
+
+@main.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Create the database tables and apply pending schema migrations."""
+    applied = upgrade_database()
+    click.echo(f"Applied migrations: {applied or 'none'} (schema version {migrations.current_version(db.engine)})")
+
+@main.cli.command('checkpoint-db')
+@click.option('--truncate', is_flag=True, help='Wait for readers and reset the WAL file to zero bytes.')
+def checkpoint_db_command(truncate):
+    """Copy the SQLite write-ahead log back into the database file."""
+    if db.engine.dialect.name != 'sqlite' or not sqlite_tuning.uses_wal:
+        click.echo('Checkpoints only apply to SQLite in WAL mode.')
+        return
+
+    busy, frames, checkpointed = sqlite_tuning.checkpoint('TRUNCATE' if truncate else 'PASSIVE')
+    click.echo(f"Checkpointed {checkpointed} of {frames} WAL frames{' (blocked by a reader)' if busy else ''}.")
+
+@main.cli.command('sync-replica')
+def sync_replica_command():
+    """Copy a SQLite primary into the SQLite replica file."""
+    try:
+        read_replica.sync_sqlite()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Replica {read_replica.engine.url.database} is now a copy of the primary.")
+
+@main.cli.command('profile-token')
+def profile_token_command():
+    """Print a signed token that profiles any request sending it in the profiler header."""
+    click.echo(f"{current_app.config['PROFILER_HEADER']}: {profiler.make_token()}")
+
+@main.cli.command('profile-report')
+@click.argument('route')
+def profile_report_command(route):
+    """Print a route's saved profiles merged into one collapsed-stack file."""
+    try:
+        samples = profiler.merged(route)
+    except FileNotFoundError:
+        raise click.ClickException(f"No profiles saved for {route}.")
+    for stack, count in samples.most_common():
+        click.echo(f"{stack} {count}")
+
+@main.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fail if a hot query falls back to a full table scan."""
+    if db.engine.dialect.name != 'sqlite':
+        click.echo('Query plan check only supports SQLite.')
+        return
+
+    failures = 0
+    try:
+        for name, call in hot_queries(add_hot_query_rows()):
+            for statement, parameters in capture_statements(call):
+                if not statement.lstrip().upper().startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE')):
+                    continue
+                plan = explain_query_plan(statement, parameters)
+                scans = table_scans(plan)
+                if scans:
+                    failures += 1
+                click.echo(f"{'FAIL' if scans else 'ok  '} {name}: {' | '.join(plan)}")
+    finally:
+        # Undo the check's rows and anything the helpers wrote, and forget what they cached
+        db.session.rollback()
+        current_app.extensions['identity_cache'].clear()
+        availability_cache.clear()
+
+    if failures:
+        raise SystemExit(1)
+
+@main.cli.command('generate-image-variants')
+def generate_image_variants_command():
+    """Write resized variants for every upload that does not have them yet."""
+    if not current_app.config['IMAGE_VARIANTS_ENABLED']:
+        click.echo('Image variants are disabled (is Pillow installed?).')
+        return
+
+    generated = 0
+    for filename in sorted(os.listdir(image_variants.static_file('uploads'))):
+        image_path = f"uploads/{filename}"
+        if not os.path.isfile(image_variants.static_file(image_path)):
+            continue
+        if image_variants.find_variant(image_path, 'thumb', ('webp',)):
+            continue
+        if image_variants.generate(image_path):
+            generated += 1
+
+    page_cache.bump('salons', *[f'salon-{salon_id}' for salon_id, in db.session.query(Salon.id)])
+    click.echo(f"Generated variants for {generated} image(s).")
+
+@main.cli.command('build-assets')
+def build_assets_command():
+    """Bundle, minify and precompress the CSS and JS."""
+    for name, filename in assets.build().items():
+        click.echo(f"{name} -> {filename}")
+
+@main.cli.command('dedupe-uploads')
+def dedupe_uploads_command():
+    """Move uploads saved before content addressing into shared, hash-named files."""
+    blobs = {path for path, in db.session.query(UploadBlob.path)}
+    moved = 0
+
+    for column in UPLOAD_REFERENCES:
+        references = db.session.query(column, db.func.count()).filter(column.like('uploads/%')).group_by(column).all()
+        for old_path, count in references:
+            if old_path in blobs:
+                continue
+
+            legacy_file = os.path.join(current_app.config['UPLOAD_FOLDER'], old_path[len('uploads/'):])
+            if not os.path.isfile(legacy_file):
+                click.echo(f"Missing file for {old_path}, left as is")
+                continue
+
+            with open(legacy_file, 'rb') as legacy_stream:
+                new_path, is_new = store_upload(legacy_stream, upload_extension(legacy_file), count)
+            db.session.execute(db.update(column.class_).where(column == old_path).values({column.key: new_path}))
+            if is_new and current_app.config['IMAGE_VARIANTS_ENABLED']:
+                image_variants.generate(new_path)
+            moved += 1
+
+    db.session.commit()
+    page_cache.bump('salons', *[f'salon-{salon_id}' for salon_id, in db.session.query(Salon.id)])
+    click.echo(f"Moved {moved} upload reference(s); run `flask gc-uploads` to delete the old files.")
+
+@main.cli.command('gc-uploads')
+@click.option('--dry-run', is_flag=True, help='Only list what would be deleted.')
+def gc_uploads_command(dry_run):
+    """Delete stored uploads that nothing references any more."""
+    grace = current_app.config['UPLOAD_GC_GRACE_SECONDS']
+    cutoff = datetime.utcnow() - timedelta(seconds=grace)
+    referenced = set()
+    for column in UPLOAD_REFERENCES:
+        referenced.update(path for path, in db.session.query(column).distinct())
+
+    def remove(path):
+        click.echo(f"{'Would delete' if dry_run else 'Deleting'} {path}")
+        if not dry_run:
+            image_variants.remove(path)
+            try:
+                os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], path[len('uploads/'):]))
+            except FileNotFoundError:
+                pass
+
+    # Blobs whose last reference was released, counting the grace period from that release
+    removed = 0
+    for blob in UploadBlob.query.filter(
+        UploadBlob.ref_count <= 0,
+        db.func.coalesce(UploadBlob.released_at, UploadBlob.date_created) < cutoff
+    ).all():
+        if blob.path in referenced:
+            # The count drifted (for example a row edited by hand); trust the references
+            blob.ref_count = sum(
+                db.session.query(db.func.count()).filter(column == blob.path).scalar() for column in UPLOAD_REFERENCES
+            )
+            current_app.logger.warning(f"Upload {blob.path} had a zero count but is referenced; reset to {blob.ref_count}")
+            continue
+        if dry_run:
+            remove(blob.path)
+            removed += 1
+            continue
+
+        # Only delete the row if no upload took a new reference in the meantime. The file
+        # goes before the commit: until then the delete holds the row (on SQLite, the
+        # database) locked, so an upload of the same bytes waits in retain_upload and
+        # then writes the file again under a new row
+        deleted = db.session.execute(
+            db.delete(UploadBlob).where(UploadBlob.path == blob.path, UploadBlob.ref_count <= 0)
+        ).rowcount
+        if deleted:
+            remove(blob.path)
+            removed += 1
+        db.session.commit()
+
+    # Files with no blob row: uploads from before content addressing and interrupted saves
+    known = {path for path, in db.session.query(UploadBlob.path)}
+    for filename in sorted(os.listdir(current_app.config['UPLOAD_FOLDER'])):
+        path = f"uploads/{filename}"
+        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+        if not os.path.isfile(file_path) or path in known or path in referenced:
+            continue
+        if os.path.getmtime(file_path) > datetime.now().timestamp() - grace:
+            continue
+        remove(path)
+        removed += 1
+
+    db.session.commit()
+    click.echo(f"{'Would remove' if dry_run else 'Removed'} {removed} unreferenced upload(s).")
+
 
 if __name__ == '__main__':
+    app = create_app()
+    # The development server sets up the database itself; deployments run `flask upgrade-db`
+    with app.app_context():
+        upgrade_database()
     app.run(debug=True)
 
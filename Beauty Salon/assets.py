@@ -0,0 +1,198 @@
+"""Bundled, minified and fingerprinted CSS and JavaScript.
+
+Each bundle concatenates the stylesheets or scripts one group of pages loads,
+minifies them and writes the result under a content-hash filename, with gzip
+and (when the brotli package is installed) brotli copies next to it. Because a
+changed bundle gets a new name, the /assets route can tell browsers to keep
+every file for a year, and repeat visits make no asset requests at all.
+
+Bundles are rebuilt on first use whenever a source file is newer than the
+manifest, or explicitly with `flask build-assets`.
+"""
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import threading
+
+from flask import abort, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+
+# Each page loads exactly one stylesheet bundle: the site styles followed by its own,
+# in the same order the separate <link> tags used to load them
+ASSET_BUNDLES = {
+    'site.css': ['css/style.css'],
+    'index.css': ['css/style.css', 'css/index.css'],
+    'find_salons.css': ['css/style.css', 'css/find_salons.css'],
+    'salon_detail.css': ['css/style.css', 'css/salon_detail.css'],
+    'booking.css': ['css/style.css', 'css/book_appointment.css'],
+    'payment.css': ['css/style.css', 'css/payment.css'],
+    'customer.css': ['css/style.css', 'css/customer.css'],
+    'salon_admin.css': ['css/style.css', 'css/salon_dashboard_profile.css'],
+    'salon_schedule.css': ['css/style.css', 'css/salon_services_slots.css'],
+    'site.js': ['js/script.js'],
+}
+
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+CSS_STRING = re.compile(r'("(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\')')
+
+
+def minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    # Odd parts are string literals and are kept exactly as written
+    parts = CSS_STRING.split(css)
+    for i in range(0, len(parts), 2):
+        code = re.sub(r'\s+', ' ', parts[i])
+        code = re.sub(r'\s*([{};,>])\s*', r'\1', code)
+        code = re.sub(r':\s+', ':', code)
+        parts[i] = code.replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+def minify_js(js):
+    # Only with rjsmin installed; a hand-rolled JS minifier is not worth the risk
+    return rjsmin.jsmin(js) if rjsmin is not None else js
+
+
+class Assets:
+    def __init__(self, app=None):
+        self.app = None
+        self._manifest = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ASSET_BUNDLES', ASSET_BUNDLES)
+        app.config.setdefault('ASSETS_OUTPUT_DIR', os.path.join(app.static_folder, 'dist'))
+        app.config.setdefault('ASSETS_MAX_AGE', 365 * 24 * 3600)
+        # Check source files for changes on every page render, for development
+        app.config.setdefault('ASSETS_AUTO_RELOAD', app.debug)
+
+        self.app = app
+        app.extensions['assets'] = self
+        app.jinja_env.globals['asset_url'] = self.url
+        app.add_url_rule('/assets/<path:filename>', 'asset', self.serve)
+
+    @property
+    def _manifest_path(self):
+        return os.path.join(self.app.config['ASSETS_OUTPUT_DIR'], 'manifest.json')
+
+    def _is_stale(self):
+        try:
+            built = os.path.getmtime(self._manifest_path)
+        except FileNotFoundError:
+            return True
+
+        static_folder = self.app.static_folder
+        sources = {source for sources in self.app.config['ASSET_BUNDLES'].values() for source in sources}
+        return any(os.path.getmtime(os.path.join(static_folder, source)) > built for source in sources)
+
+    def _bundle_source(self, name, sources):
+        chunks = []
+        for source in sources:
+            with open(os.path.join(self.app.static_folder, source), encoding='utf-8') as source_file:
+                text = source_file.read()
+
+            if name.endswith('.css'):
+                # Bundles are served from /assets, so relative url()s must point back into /static
+                base = posixpath.dirname(source)
+
+                def absolute(match):
+                    quote, target = match.groups()
+                    if target.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+                        return match.group(0)
+                    path = posixpath.normpath(posixpath.join(base, target))
+                    return f"url({quote}{self.app.static_url_path}/{path}{quote})"
+
+                text = CSS_URL.sub(absolute, text)
+            chunks.append(text)
+
+        if name.endswith('.css'):
+            return minify_css('\n'.join(chunks))
+        # A newline and semicolon keep one script's last statement out of the next
+        return minify_js('\n;\n'.join(chunks))
+
+    def build(self):
+        # Write every bundle and its compressed copies; returns the new manifest
+        output_dir = self.app.config['ASSETS_OUTPUT_DIR']
+        os.makedirs(output_dir, exist_ok=True)
+
+        manifest = {}
+        for name, sources in self.app.config['ASSET_BUNDLES'].items():
+            content = self._bundle_source(name, sources).encode('utf-8')
+            stem, extension = os.path.splitext(name)
+            filename = f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{extension}"
+            manifest[name] = filename
+
+            outputs = [(filename, content), (f"{filename}.gz", gzip.compress(content, 9, mtime=0))]
+            if brotli is not None:
+                outputs.append((f"{filename}.br", brotli.compress(content, quality=11)))
+
+            for output_name, data in outputs:
+                path = os.path.join(output_dir, output_name)
+                if os.path.exists(path):
+                    continue
+                temp_path = f"{path}.{os.getpid()}.tmp"
+                with open(temp_path, 'wb') as output_file:
+                    output_file.write(data)
+                os.replace(temp_path, path)
+
+        # Older bundles stay on disk so pages cached with their URLs keep working
+        temp_path = f"{self._manifest_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+        os.replace(temp_path, self._manifest_path)
+
+        self._manifest = manifest
+        return manifest
+
+    @property
+    def manifest(self):
+        if self._manifest is None or self.app.config['ASSETS_AUTO_RELOAD']:
+            with self._lock:
+                if self._is_stale():
+                    self.build()
+                elif self._manifest is None or self.app.config['ASSETS_AUTO_RELOAD']:
+                    with open(self._manifest_path) as manifest_file:
+                        self._manifest = json.load(manifest_file)
+        return self._manifest
+
+    def url(self, name, **values):
+        # Like url_for('static', filename=...), but for a bundle name
+        return url_for('asset', filename=self.manifest[name], **values)
+
+    def serve(self, filename):
+        output_dir = self.app.config['ASSETS_OUTPUT_DIR']
+        if filename.endswith(('.gz', '.br', '.json')) or not os.path.isfile(os.path.join(output_dir, filename)):
+            abort(404)
+
+        encodings = [('br', '.br'), ('gzip', '.gz')]
+        for encoding, suffix in encodings:
+            if encoding in request.accept_encodings and os.path.isfile(os.path.join(output_dir, filename + suffix)):
+                response = send_from_directory(output_dir, filename + suffix, mimetype=_mimetype(filename))
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(output_dir, filename, mimetype=_mimetype(filename))
+
+        # The name changes with the content, so the file can be cached forever
+        response.headers['Cache-Control'] = f"public, max-age={self.app.config['ASSETS_MAX_AGE']}, immutable"
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+
+def _mimetype(filename):
+    return 'text/css' if filename.endswith('.css') else 'application/javascript'
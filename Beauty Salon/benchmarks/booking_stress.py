@@ -0,0 +1,172 @@
+"""Multi-threaded booking stress test.
+
+Many customers race through the real book_appointment route for a small pool of
+30-minute time slots, booking services of 30, 60 and 90 minutes. The run fails
+if any two open appointments of the salon overlap in time, or if the taken slots
+do not match what the appointments cover. It reports how many bookings per
+second went through.
+
+Customers are spread over --processes forked workers sharing the database, each
+with its own availability cache, as under gunicorn. A worker's cached view goes
+stale when another worker books, so the reservation itself has to reject
+overlaps rather than the availability check in front of it.
+
+    python benchmarks/booking_stress.py --processes 2 --threads 8 --slots 200 --attempts 50
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, time as dtime
+
+# Point the app at a throwaway database before it is imported
+scratch_dir = tempfile.mkdtemp(prefix='salon-stress-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(scratch_dir, 'stress.db')}")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import create_app, upgrade_database, db, User, Salon, Service, TimeSlot, Appointment  # noqa: E402
+
+app = create_app({'WTF_CSRF_ENABLED': False})
+
+PASSWORD = 'stress-test'
+DURATIONS = (30, 60, 90)  # minutes; one service of each
+
+
+def seed(customers, slots):
+    password = generate_password_hash(PASSWORD)
+    owner = User(email='owner@stress.test', password=password, name='Owner', role='salon_owner')
+    db.session.add(owner)
+    db.session.flush()
+
+    salon = Salon(owner_id=owner.id, name='Stress Salon', location='Benchmark')
+    db.session.add(salon)
+    db.session.flush()
+
+    services = [Service(salon_id=salon.id, name=f'Service {duration}', price=100, duration=duration) for duration in DURATIONS]
+    db.session.add_all(services)
+
+    for i in range(customers):
+        db.session.add(User(email=f'customer{i}@stress.test', password=password, name=f'Customer {i}', role='customer'))
+
+    day = datetime.now().date() + timedelta(days=1)
+    slot_times = []
+    for i in range(slots):
+        slot_day = day + timedelta(days=i // 20)
+        start = dtime(9 + (i % 20) // 2, 30 * (i % 2))
+        end = dtime(start.hour, 30) if start.minute == 0 else dtime(start.hour + 1, 0)
+        db.session.add(TimeSlot(salon_id=salon.id, date=slot_day, start_time=start, end_time=end, is_available=True))
+        slot_times.append((slot_day.strftime('%Y-%m-%d'), start.strftime('%H:%M')))
+
+    db.session.commit()
+    return salon.id, [service.id for service in services], slot_times
+
+
+def customer_worker(index, salon_id, service_ids, slot_times, attempts, results, barrier):
+    client = app.test_client()
+    client.post('/login', data={'email': f'customer{index}@stress.test', 'password': PASSWORD})
+    barrier.wait()
+
+    booked = taken = 0
+    for _ in range(attempts):
+        date_str, time_str = random.choice(slot_times)
+        response = client.post(f'/salon/{salon_id}/book', data={
+            'service_id': random.choice(service_ids),
+            'date': date_str,
+            'time': time_str,
+        })
+        if response.headers.get('Location', '').endswith('/customer/dashboard'):
+            booked += 1
+        else:
+            taken += 1
+
+    results[index] = (booked, taken)
+
+
+def worker_process(first_customer, threads, salon_id, service_ids, slot_times, attempts, barrier, totals):
+    results = {}  # customer index -> (booked, taken)
+    workers = [
+        threading.Thread(target=customer_worker, args=(i, salon_id, service_ids, slot_times, attempts, results, barrier))
+        for i in range(first_customer, first_customer + threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    totals.put((sum(result[0] for result in results.values()), sum(result[1] for result in results.values())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=2, help='forked workers, each with its own caches')
+    parser.add_argument('--threads', type=int, default=8, help='customers per process')
+    parser.add_argument('--slots', type=int, default=200)
+    parser.add_argument('--attempts', type=int, default=50, help='booking attempts per thread')
+    args = parser.parse_args()
+
+    with app.app_context():
+        upgrade_database()
+        salon_id, service_ids, slot_times = seed(args.processes * args.threads, args.slots)
+
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(args.processes * args.threads + 1)
+    totals = context.Queue()
+    processes = [
+        context.Process(target=worker_process, args=(
+            number * args.threads, args.threads, salon_id, service_ids, slot_times, args.attempts, barrier, totals
+        ))
+        for number in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    barrier.wait()
+    started = time.perf_counter()
+    counts = [totals.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+
+    booked = sum(count[0] for count in counts)
+    rejected = sum(count[1] for count in counts)
+
+    with app.app_context():
+        booked_intervals = {}
+        for day, start, duration in db.session.query(
+            Appointment.date, Appointment.time, Service.duration
+        ).join(
+            Service, Appointment.service_id == Service.id
+        ).filter(
+            Appointment.salon_id == salon_id,
+            Appointment.status != 'cancelled'
+        ):
+            start_minutes = start.hour * 60 + start.minute
+            booked_intervals.setdefault(day, []).append((start_minutes, start_minutes + duration))
+
+        # Any appointment starting before the previous one on that day ends is a double booking
+        appointments = overlapping = covered_slots = 0
+        for intervals in booked_intervals.values():
+            intervals.sort()
+            appointments += len(intervals)
+            covered_slots += sum((end - start) // 30 for start, end in intervals)
+            overlapping += sum(1 for previous, current in zip(intervals, intervals[1:]) if current[0] < previous[1])
+        taken_slots = TimeSlot.query.filter_by(salon_id=salon_id, is_available=False).count()
+
+    print(f"processes={args.processes} threads={args.threads} slots={args.slots} "
+          f"attempts={args.processes * args.threads * args.attempts}")
+    print(f"booked={booked} rejected={rejected} appointments={appointments} taken_slots={taken_slots}")
+    print(f"elapsed={elapsed:.2f}s bookings_per_second={booked / elapsed:.1f} requests_per_second={(booked + rejected) / elapsed:.1f}")
+
+    if overlapping or appointments != booked or taken_slots != covered_slots:
+        print(f"FAIL: {overlapping} appointments overlap another; {taken_slots} slots taken for {covered_slots} booked")
+        sys.exit(1)
+    print('OK: no double bookings')
+
+
+if __name__ == '__main__':
+    main()
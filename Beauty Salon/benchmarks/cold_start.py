@@ -0,0 +1,111 @@
+"""Worker cold start: importing the app, creating it and serving a first request.
+
+A pre-forking server either starts each worker from a fresh interpreter, or
+creates the app once in the master and forks workers from it (gunicorn
+--preload). Each way is measured on a throwaway database:
+
+    fresh   a new interpreter imports app.py, calls create_app() and serves GET /
+    forked  a process that already created the app forks; the child serves GET /
+    warm    as forked, but the parent also ran warm_up(), as wsgi.py does
+
+    python benchmarks/cold_start.py --runs 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+started = time.perf_counter()
+
+# Point the app at a throwaway database before it is imported
+scratch_dir = tempfile.mkdtemp(prefix='salon-cold-start-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(scratch_dir, 'app.db')}")
+app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, app_dir)
+
+
+def first_request(app):
+    began = time.perf_counter()
+    response = app.test_client().get('/')
+    if response.status_code != 200:
+        raise RuntimeError(f"GET / returned {response.status_code}")
+    return (time.perf_counter() - began) * 1000
+
+
+def measure_fresh():
+    # Runs in its own interpreter; the module-level code above is part of the start
+    began = time.perf_counter()
+    import app as salon_app
+    imported = time.perf_counter()
+    app = salon_app.create_app()
+    created = time.perf_counter()
+    request_ms = first_request(app)
+    print(json.dumps({
+        'import': (imported - began) * 1000,
+        'create_app': (created - imported) * 1000,
+        'first_request': request_ms,
+        'total': (time.perf_counter() - started) * 1000,
+    }))
+
+
+def run_fresh():
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--measure-fresh'],
+        cwd=app_dir, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def run_forked(app):
+    read_end, write_end = os.pipe()
+    began = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        request_ms = first_request(app)
+        result = {'first_request': request_ms, 'total': (time.perf_counter() - began) * 1000}
+        os.write(write_end, json.dumps(result).encode())
+        os._exit(0)
+
+    os.close(write_end)
+    with os.fdopen(read_end) as pipe:
+        result = json.loads(pipe.read())
+    os.waitpid(pid, 0)
+    return result
+
+
+def summarize(label, results):
+    keys = results[0].keys()
+    medians = {key: sorted(result[key] for result in results)[len(results) // 2] for key in keys}
+    print(f"{label:7} " + ' '.join(f"{key}={value:.1f}ms" for key, value in medians.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--measure-fresh', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure_fresh:
+        measure_fresh()
+        return
+
+    from app import create_app, upgrade_database, warm_up
+
+    app = create_app()
+    with app.app_context():
+        upgrade_database()
+    app.extensions['assets'].build()
+
+    print(f"runs={args.runs} (medians)")
+    summarize('fresh', [run_fresh() for _ in range(args.runs)])
+    summarize('forked', [run_forked(app) for _ in range(args.runs)])
+    warm_up(app)
+    summarize('warm', [run_forked(app) for _ in range(args.runs)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""Realistic traffic against a seeded database, with latency and SQL per request.
+
+Runs a weighted mix of the main pages through the Flask test client, from
+several threads. Each thread browses as an anonymous visitor, a logged-in
+customer and a salon owner. Popular salons get most of the traffic. Reports
+throughput and, per page, p50/p95/p99 latency and SQL queries per request.
+Results are written as JSON so later runs can be compared against them:
+
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/seed.py --salons 2000
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/load_test.py --requests 5000 --threads 4
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/load_test.py --compare benchmarks/results/<earlier>.json
+
+Bookings are real, so a run changes the database; reseed for strict
+comparisons.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event  # noqa: E402
+
+from app import create_app, db, User, Service  # noqa: E402
+
+PASSWORD = 'password'  # as written by benchmarks/seed.py
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Share of requests per page
+MIX = {
+    'index': 15,
+    'find_salons': 25,
+    'salon_detail': 25,
+    'book_appointment': 10,
+    'customer_dashboard': 15,
+    'salon_dashboard': 10,
+}
+SEARCH_TERMS = ['glow', 'velvet', 'silk', 'gulshan', 'dhaka', 'haircut', 'facial', 'massage', 'uttara']
+
+
+class Visitor:
+    # One thread's browsing: its own clients, random source and measurements
+    def __init__(self, app, index, args, service_ids, customer_emails, owner_emails):
+        self.rng = random.Random(args.seed * 1000 + index)
+        self.service_ids = service_ids  # a service to book at each salon
+        self.salon_count = max(service_ids)
+        self.anonymous = app.test_client()
+        self.customer = self._login(app, customer_emails[index % len(customer_emails)])
+        self.owner = self._login(app, owner_emails[index % len(owner_emails)])
+        self.samples = {page: [] for page in MIX}
+        self.errors = {page: 0 for page in MIX}
+
+    def _login(self, app, email):
+        client = app.test_client()
+        response = client.post('/login', data={'email': email, 'password': PASSWORD})
+        if response.status_code != 302:
+            sys.exit(f"Could not log in as {email}; was the database made by benchmarks/seed.py?")
+        return client
+
+    def popular_salon(self):
+        # Roughly 80% of visits go to 20% of salons
+        if self.rng.random() < 0.8:
+            return self.rng.randint(1, max(1, self.salon_count // 5))
+        return self.rng.randint(1, self.salon_count)
+
+    def request(self, page):
+        rng = self.rng
+        if page == 'index':
+            return self.anonymous.get('/')
+        if page == 'find_salons':
+            choice = rng.random()
+            if choice < 0.4:
+                return self.anonymous.get('/find-salons')
+            if choice < 0.8:
+                return self.anonymous.get('/find-salons', query_string={'search': rng.choice(SEARCH_TERMS)})
+            return self.anonymous.get('/find-salons', query_string={'after': rng.randint(1, self.salon_count)})
+        if page == 'salon_detail':
+            client = self.customer if rng.random() < 0.3 else self.anonymous
+            return client.get(f'/salon/{self.popular_salon()}')
+        if page == 'book_appointment':
+            salon_id = self.popular_salon()
+            day = datetime.now().date() + timedelta(days=rng.randint(0, 13))
+            minutes = 9 * 60 + 30 * rng.randint(0, 7)
+            return self.customer.post(f'/salon/{salon_id}/book', data={
+                'service_id': self.service_ids[salon_id],
+                'date': day.strftime('%Y-%m-%d'),
+                'time': f'{minutes // 60:02d}:{minutes % 60:02d}',
+            })
+        if page == 'customer_dashboard':
+            return self.customer.get('/customer/dashboard')
+        return self.owner.get('/salon/dashboard')
+
+
+# Per-thread SQL statement count, so concurrent requests do not mix their queries
+query_counter = threading.local()
+
+
+def count_query(*args):
+    query_counter.count = getattr(query_counter, 'count', 0) + 1
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(app, args):
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', count_query)
+        customers = [email for (email,) in db.session.query(User.email).filter_by(role='customer').order_by(User.id).limit(args.threads)]
+        owners = [email for (email,) in db.session.query(User.email).filter_by(role='salon_owner').order_by(User.id).limit(args.threads)]
+        service_ids = dict(db.session.query(Service.salon_id, db.func.min(Service.id)).group_by(Service.salon_id))
+    if not service_ids or not customers or not owners:
+        sys.exit('The database has no salons or accounts; seed it with benchmarks/seed.py first.')
+
+    visitors = [Visitor(app, index, args, service_ids, customers, owners) for index in range(args.threads)]
+    pages, weights = list(MIX), list(MIX.values())
+    barrier = threading.Barrier(args.threads + 1)
+
+    def browse(visitor, requests, record):
+        for _ in range(requests):
+            page = visitor.rng.choices(pages, weights)[0]
+            query_counter.count = 0
+            started = time.perf_counter()
+            response = visitor.request(page)
+            elapsed = time.perf_counter() - started
+            if record:
+                if response.status_code >= 500:
+                    visitor.errors[page] += 1
+                visitor.samples[page].append((elapsed, query_counter.count))
+
+    def worker(visitor):
+        browse(visitor, args.warmup // args.threads, False)
+        barrier.wait()
+        browse(visitor, args.requests // args.threads, True)
+
+    threads = [threading.Thread(target=worker, args=(visitor,)) for visitor in visitors]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for page in MIX:
+        samples = [sample for visitor in visitors for sample in visitor.samples[page]]
+        latencies = [latency * 1000 for latency, _ in samples]
+        results[page] = {
+            'requests': len(samples),
+            'errors': sum(visitor.errors[page] for visitor in visitors),
+            'p50_ms': percentile(latencies, 0.5),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'queries_per_request': sum(count for _, count in samples) / len(samples) if samples else 0.0,
+        }
+    total = sum(result['requests'] for result in results.values())
+    return {'requests_per_second': total / elapsed, 'elapsed_seconds': elapsed, 'pages': results}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def report(summary, baseline=None):
+    def change(key, page=None):
+        if baseline is None:
+            return ''
+        old = baseline['pages'].get(page, {}).get(key) if page else baseline.get(key)
+        new = summary['pages'][page][key] if page else summary[key]
+        if not old:
+            return ''
+        return f" ({(new - old) / old * 100:+.0f}%)"
+
+    print(f"requests/s={summary['requests_per_second']:.1f}{change('requests_per_second')}")
+    print(f"{'page':20} {'requests':>8} {'errors':>6} {'p50 ms':>14} {'p95 ms':>14} {'p99 ms':>14} {'queries':>13}")
+    for page, result in summary['pages'].items():
+        print(
+            f"{page:20} {result['requests']:8} {result['errors']:6} "
+            f"{result['p50_ms']:7.1f}{change('p50_ms', page):>7} "
+            f"{result['p95_ms']:7.1f}{change('p95_ms', page):>7} "
+            f"{result['p99_ms']:7.1f}{change('p99_ms', page):>7} "
+            f"{result['queries_per_request']:6.1f}{change('queries_per_request', page):>7}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000, help='measured requests, across all threads')
+    parser.add_argument('--warmup', type=int, default=200, help='unmeasured requests first, across all threads')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help=f'where to save the results (default: a new file in {RESULTS_DIR})')
+    parser.add_argument('--compare', help='earlier results file to show changes against')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)['summary']
+
+    app = create_app({'WTF_CSRF_ENABLED': False})
+    summary = run(app, args)
+    report(summary, baseline)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as output_file:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'database': app.config['SQLALCHEMY_DATABASE_URI'],
+            'arguments': vars(args),
+            'summary': summary,
+        }, output_file, indent=2)
+    print(f"Saved {output}")
+
+
+if __name__ == '__main__':
+    main()
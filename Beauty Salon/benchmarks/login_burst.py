@@ -0,0 +1,149 @@
+"""Login throughput against booking latency during a login burst.
+
+Booking threads keep booking through the real route while login threads sign
+in as fast as they can. Each phase runs in its own process on a fresh
+database, and reports logins per second, logins turned away with 503, and
+booking latency percentiles:
+
+    baseline   bookings only
+    unbounded  as many hashing threads as login threads, like hashing inline
+    pooled     the configured hashing pool (PASSWORD_HASH_WORKERS and queue)
+
+    python benchmarks/login_burst.py --login-threads 16 --booking-threads 4 --seconds 10
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, time as dtime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = 'login-burst'
+
+
+def seed(app, login_users, booking_users):
+    from app import db, password_hasher, User, Salon, Service, TimeSlot
+
+    password = password_hasher.hash(PASSWORD)
+    owner = User(email='owner@burst.test', password=password, name='Owner', role='salon_owner')
+    db.session.add(owner)
+    db.session.flush()
+
+    salon = Salon(owner_id=owner.id, name='Burst Salon', location='Benchmark')
+    db.session.add(salon)
+    db.session.flush()
+    service = Service(salon_id=salon.id, name='Haircut', price=100, duration=30)
+    db.session.add(service)
+
+    for i in range(login_users):
+        db.session.add(User(email=f'login{i}@burst.test', password=password, name=f'Login {i}', role='customer'))
+    for i in range(booking_users):
+        db.session.add(User(email=f'booker{i}@burst.test', password=password, name=f'Booker {i}', role='customer'))
+
+    day = datetime.now().date() + timedelta(days=1)
+    slot_times = []
+    for i in range(2000):
+        slot_day = day + timedelta(days=i // 20)
+        start = dtime(9 + (i % 20) // 2, 30 * (i % 2))
+        end = dtime(start.hour, 30) if start.minute == 0 else dtime(start.hour + 1, 0)
+        db.session.add(TimeSlot(salon_id=salon.id, date=slot_day, start_time=start, end_time=end, is_available=True))
+        slot_times.append((slot_day.strftime('%Y-%m-%d'), start.strftime('%H:%M')))
+
+    db.session.commit()
+    return salon.id, service.id, slot_times
+
+
+def run_phase(args):
+    from app import create_app, upgrade_database
+
+    app = create_app({'WTF_CSRF_ENABLED': False})
+    with app.app_context():
+        upgrade_database()
+        salon_id, service_id, slot_times = seed(app, args.login_threads, args.booking_threads)
+
+    logins = {'ok': 0, 'busy': 0}
+    logins_lock = threading.Lock()
+    booking_latencies = []
+    stop = threading.Event()
+    barrier = threading.Barrier(args.login_threads + args.booking_threads + 1)
+
+    def login_worker(index):
+        barrier.wait()
+        while not stop.is_set():
+            response = app.test_client().post('/login', data={'email': f'login{index}@burst.test', 'password': PASSWORD})
+            with logins_lock:
+                logins['ok' if response.status_code == 302 else 'busy'] += 1
+
+    def booking_worker(index):
+        client = app.test_client()
+        client.post('/login', data={'email': f'booker{index}@burst.test', 'password': PASSWORD})
+        barrier.wait()
+        while not stop.is_set():
+            date_str, time_str = random.choice(slot_times)
+            started = time.perf_counter()
+            client.post(f'/salon/{salon_id}/book', data={'service_id': service_id, 'date': date_str, 'time': time_str})
+            booking_latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=login_worker, args=(i,)) for i in range(args.login_threads)]
+    threads += [threading.Thread(target=booking_worker, args=(i,)) for i in range(args.booking_threads)]
+    for thread in threads:
+        thread.start()
+
+    barrier.wait()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    booking_latencies.sort()
+
+    def percentile(fraction):
+        return booking_latencies[min(len(booking_latencies) - 1, int(len(booking_latencies) * fraction))] * 1000
+
+    print(json.dumps({
+        'logins_per_second': logins['ok'] / args.seconds,
+        'logins_busy': logins['busy'],
+        'bookings_per_second': len(booking_latencies) / args.seconds,
+        'booking_p50_ms': percentile(0.5),
+        'booking_p99_ms': percentile(0.99),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--login-threads', type=int, default=16)
+    parser.add_argument('--booking-threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--phase', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        run_phase(args)
+        return
+
+    print(f"login_threads={args.login_threads} booking_threads={args.booking_threads} seconds={args.seconds}")
+    phases = [
+        ('baseline', {}, 0),
+        ('unbounded', {'FLASK_PASSWORD_HASH_WORKERS': str(args.login_threads), 'FLASK_PASSWORD_HASH_QUEUE_SIZE': '0'}, args.login_threads),
+        ('pooled', {}, args.login_threads),
+    ]
+    for label, settings, login_threads in phases:
+        scratch_dir = tempfile.mkdtemp(prefix='salon-login-burst-')
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(scratch_dir, 'app.db')}", **settings)
+        output = subprocess.run([
+            sys.executable, os.path.abspath(__file__), '--phase', label,
+            '--login-threads', str(login_threads), '--booking-threads', str(args.booking_threads),
+            '--seconds', str(args.seconds),
+        ], env=env, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        print(f"{label:9} " + ' '.join(f"{key}={value:.1f}" for key, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""Fill an empty database with synthetic salons, customers and bookings.
+
+The same --seed gives the same data, with dates relative to the day of the
+run. Every account uses the password "password"; owners are
+owner<N>@seed.test and customers customer<N>@seed.test, numbered from 1.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/seed.py --salons 10000 --days 14 --slots-per-day 8
+
+Those settings come to about 1.1M time slots. After the rows are in, the
+schema migrations, the search index and ANALYZE run as they would on a real
+database.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, time as dtime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import (  # noqa: E402
+    create_app, upgrade_database, db,
+    User, Salon, Service, Employee, TimeSlot, Appointment, Review, Notification,
+)
+
+PASSWORD = 'password'
+CHUNK_SIZE = 20000
+
+SERVICES = [
+    ('Haircut', 30, 15), ('Beard Trim', 30, 8), ('Hair Colouring', 60, 45), ('Manicure', 30, 20),
+    ('Pedicure', 60, 25), ('Facial', 60, 40), ('Massage', 60, 50), ('Blow Dry', 30, 18),
+    ('Waxing', 30, 22), ('Bridal Makeup', 60, 120),
+]
+CITIES = ['Dhaka', 'Chittagong', 'Sylhet', 'Khulna', 'Rajshahi', 'Barisal', 'Rangpur', 'Comilla']
+AREAS = ['Gulshan', 'Banani', 'Dhanmondi', 'Uttara', 'Mirpur', 'Motijheel', 'Bashundhara', 'Mohammadpur']
+NAME_PARTS = ['Glow', 'Velvet', 'Luxe', 'Bloom', 'Aura', 'Silk', 'Serene', 'Urban', 'Golden', 'Pearl']
+COMMENTS = ['Lovely service.', 'Friendly staff and on time.', 'A bit pricey but worth it.', 'Would book again.', 'Okay.']
+STATUSES = ['pending', 'confirmed', 'confirmed', 'completed', 'cancelled']
+
+
+class ChunkedInsert:
+    # Collects rows per table and inserts them in executemany batches. Tables are
+    # always flushed in the order they were first added to, so parents go first.
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = {}
+        self.counts = {}
+
+    def add(self, model, row):
+        rows = self.rows.setdefault(model, [])
+        rows.append(row)
+        if len(rows) >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        for model, rows in self.rows.items():
+            if rows:
+                self.connection.execute(db.insert(model.__table__), rows)
+                self.counts[model.__name__] = self.counts.get(model.__name__, 0) + len(rows)
+                rows.clear()
+
+
+def seed(connection, args, rng):
+    today = datetime.now().date()
+    now = datetime.now()
+    password = generate_password_hash(PASSWORD)
+    rows = ChunkedInsert(connection)
+
+    salon_ids = range(1, args.salons + 1)
+    customer_ids = range(args.salons + 1, args.salons + args.customers + 1)
+
+    for salon_id in salon_ids:
+        rows.add(User, {'id': salon_id, 'email': f'owner{salon_id}@seed.test', 'password': password,
+                        'name': f'Owner {salon_id}', 'role': 'salon_owner', 'date_created': now})
+    for number, customer_id in enumerate(customer_ids, 1):
+        rows.add(User, {'id': customer_id, 'email': f'customer{number}@seed.test', 'password': password,
+                        'name': f'Customer {number}', 'role': 'customer', 'date_created': now})
+
+    service_id = 0
+    appointment_id = 0
+    for salon_id in salon_ids:
+        offered = rng.sample(SERVICES, args.services_per_salon)
+        reviews = [rng.choices([1, 2, 3, 4, 5], weights=[1, 1, 3, 5, 6])[0] for _ in range(rng.randint(0, args.reviews_per_salon * 2))]
+        rows.add(Salon, {
+            'id': salon_id, 'owner_id': salon_id,
+            'name': f'{rng.choice(NAME_PARTS)} {rng.choice(NAME_PARTS)} Salon {salon_id}',
+            'location': f'{rng.choice(AREAS)}, {rng.choice(CITIES)}',
+            'description': f'We offer {", ".join(name.lower() for name, _, _ in offered)}.',
+            'phone': f'01{rng.randint(300000000, 999999999)}',
+            'opening_time': '09:00', 'closing_time': '18:00', 'weekly_closing': rng.choice(['Friday', 'Sunday']),
+            'rating_sum': sum(reviews), 'rating_count': len(reviews),
+        })
+
+        services = []
+        for name, duration, price in offered:
+            service_id += 1
+            services.append((service_id, duration))
+            rows.add(Service, {'id': service_id, 'salon_id': salon_id, 'name': name, 'duration': duration,
+                               'price': round(price * rng.uniform(0.7, 1.5), 2), 'description': f'{name} by our team'})
+        half_hour_services = [service for service in services if service[1] == 30] or services
+        for rating in reviews:
+            rows.add(Review, {'salon_id': salon_id, 'customer_id': rng.choice(customer_ids), 'rating': rating,
+                              'comment': rng.choice(COMMENTS), 'date_posted': now - timedelta(minutes=rng.randint(1, 525600))})
+
+        for number in range(args.employees_per_salon):
+            rows.add(Employee, {'salon_id': salon_id, 'name': f'Stylist {salon_id}-{number + 1}',
+                                'role': rng.choice(['Stylist', 'Barber', 'Beautician']), 'image': 'default_employee.jpg'})
+
+        # Upcoming slots; a share of them are booked, each by one appointment
+        for day in range(args.days):
+            slot_date = today + timedelta(days=day)
+            for number in range(args.slots_per_day):
+                start = dtime(9 + number // 2, 30 * (number % 2))
+                end = dtime(9 + (number + 1) // 2, 30 * ((number + 1) % 2))
+                booked = rng.random() < args.booked_fraction
+                rows.add(TimeSlot, {'salon_id': salon_id, 'date': slot_date, 'start_time': start,
+                                    'end_time': end, 'is_available': not booked})
+                if booked:
+                    appointment_id += 1
+                    rows.add(Appointment, {
+                        'id': appointment_id, 'customer_id': rng.choice(customer_ids), 'salon_id': salon_id,
+                        'service_id': rng.choice(half_hour_services)[0], 'date': slot_date, 'time': start,
+                        'status': rng.choice(['pending', 'confirmed']), 'created_at': now,
+                    })
+
+    # History for the dashboards
+    for customer_id in customer_ids:
+        for _ in range(args.past_appointments_per_customer):
+            salon_id = rng.choice(salon_ids)
+            appointment_id += 1
+            rows.add(Appointment, {
+                'id': appointment_id, 'customer_id': customer_id, 'salon_id': salon_id,
+                'service_id': (salon_id - 1) * args.services_per_salon + 1,
+                'date': today - timedelta(days=rng.randint(1, 365)), 'time': dtime(rng.randint(9, 17)),
+                'status': rng.choice(STATUSES), 'created_at': now,
+            })
+
+    for user_id in list(salon_ids) + list(customer_ids):
+        for number in range(args.notifications_per_user):
+            rows.add(Notification, {
+                'user_id': user_id, 'content': f'Notification {number + 1}', 'type': 'appointment',
+                'is_read': rng.random() < 0.7, 'timestamp': now - timedelta(minutes=rng.randint(1, 43200)),
+            })
+
+    rows.flush()
+    return rows.counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--salons', type=int, default=1000)
+    parser.add_argument('--customers', type=int, default=None, help='default: twice the salons')
+    parser.add_argument('--services-per-salon', type=int, default=5)
+    parser.add_argument('--employees-per-salon', type=int, default=3)
+    parser.add_argument('--reviews-per-salon', type=int, default=20, help='average')
+    parser.add_argument('--days', type=int, default=14, help='days of upcoming time slots')
+    parser.add_argument('--slots-per-day', type=int, default=8, help='30-minute slots from 09:00')
+    parser.add_argument('--booked-fraction', type=float, default=0.2)
+    parser.add_argument('--past-appointments-per-customer', type=int, default=5)
+    parser.add_argument('--notifications-per-user', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    args.customers = args.customers if args.customers is not None else args.salons * 2
+    args.services_per_salon = min(args.services_per_salon, len(SERVICES))
+    args.slots_per_day = min(args.slots_per_day, 18)
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        if db.session.query(User.id).first() is not None:
+            sys.exit('The database already has users; point DATABASE_URL at an empty database.')
+
+        started = time.perf_counter()
+        with db.engine.begin() as connection:
+            counts = seed(connection, args, random.Random(args.seed))
+        upgrade_database()
+        with db.engine.begin() as connection:
+            connection.execute(db.text('ANALYZE'))
+
+    print(f"Seeded {app.config['SQLALCHEMY_DATABASE_URI']} in {time.perf_counter() - started:.1f}s")
+    for table, count in sorted(counts.items()):
+        print(f"  {table:12} {count}")
+
+
+if __name__ == '__main__':
+    main()
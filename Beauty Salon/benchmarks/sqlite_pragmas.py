@@ -0,0 +1,185 @@
+"""Mixed read/write throughput of SQLite with default and tuned connection settings.
+
+Several worker processes, like gunicorn workers, share one database file. Each
+runs a mix of the app's hot reads (a salon page's reviews and a day's free
+slots) and booking writes (an appointment, the slot it takes and an outbox
+row, in one transaction) for a fixed time. The run is repeated on a fresh
+database with SQLite's defaults and with sqlite_tuning.DEFAULT_PRAGMAS, and
+reports operations per second, latency percentiles and "database is locked"
+errors for both.
+
+    python benchmarks/sqlite_pragmas.py --workers 8 --seconds 10 --write-ratio 0.2
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, time as dtime
+
+# Point the app at a throwaway database before it is imported
+scratch_dir = tempfile.mkdtemp(prefix='salon-pragmas-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(scratch_dir, 'app.db')}")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event, insert, select, update  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from app import db, User, Salon, Service, TimeSlot, Appointment, Review, NotificationOutbox  # noqa: E402
+from sqlite_tuning import DEFAULT_PRAGMAS, apply_pragmas  # noqa: E402
+
+SALONS = 50
+DAYS = 14
+
+
+def make_engine(path, tuned):
+    engine = create_engine(f"sqlite:///{path}")
+    if tuned:
+        event.listen(engine, 'connect', lambda connection, record: apply_pragmas(connection, DEFAULT_PRAGMAS))
+    return engine
+
+
+def seed(engine):
+    db.metadata.create_all(engine)
+    today = datetime.now().date()
+    with engine.begin() as connection:
+        connection.execute(insert(User), [
+            {'id': i, 'email': f'user{i}@bench.test', 'password': 'x', 'name': f'User {i}',
+             'role': 'salon_owner' if i <= SALONS else 'customer'}
+            for i in range(1, SALONS + 501)
+        ])
+        connection.execute(insert(Salon), [
+            {'id': i, 'owner_id': i, 'name': f'Salon {i}', 'location': 'Bench'} for i in range(1, SALONS + 1)
+        ])
+        connection.execute(insert(Service), [
+            {'id': i, 'salon_id': i, 'name': 'Haircut', 'price': 100, 'duration': 30} for i in range(1, SALONS + 1)
+        ])
+        connection.execute(insert(Review), [
+            {'salon_id': random.randint(1, SALONS), 'customer_id': random.randint(SALONS + 1, SALONS + 500),
+             'rating': random.randint(1, 5), 'comment': 'Lovely', 'date_posted': datetime.now() - timedelta(minutes=i)}
+            for i in range(20000)
+        ])
+        connection.execute(insert(TimeSlot), [
+            {'salon_id': salon_id, 'date': today + timedelta(days=day),
+             'start_time': dtime(9 + half // 2, 30 * (half % 2)),
+             'end_time': dtime(9 + (half + 1) // 2, 30 * ((half + 1) % 2)), 'is_available': True}
+            for salon_id in range(1, SALONS + 1) for day in range(DAYS) for half in range(18)
+        ])
+
+
+def read(connection, today):
+    salon_id = random.randint(1, SALONS)
+    connection.execute(select(Salon).where(Salon.id == salon_id)).one()
+    connection.execute(
+        select(Review).where(Review.salon_id == salon_id).order_by(Review.date_posted.desc(), Review.id.desc()).limit(10)
+    ).all()
+    connection.execute(
+        select(TimeSlot).where(
+            TimeSlot.salon_id == salon_id,
+            TimeSlot.date == today + timedelta(days=random.randrange(DAYS)),
+            TimeSlot.is_available == True
+        ).order_by(TimeSlot.start_time)
+    ).all()
+
+
+def write(connection, today):
+    salon_id = random.randint(1, SALONS)
+    day = today + timedelta(days=random.randrange(DAYS))
+    start = dtime(9 + random.randrange(9), 30 * random.randrange(2))
+    customer_id = random.randint(SALONS + 1, SALONS + 500)
+    with connection.begin():
+        taken = connection.execute(
+            update(TimeSlot).where(
+                TimeSlot.salon_id == salon_id, TimeSlot.date == day,
+                TimeSlot.start_time == start, TimeSlot.is_available == True
+            ).values(is_available=False)
+        ).rowcount
+        if taken:
+            connection.execute(insert(Appointment).values(
+                customer_id=customer_id, salon_id=salon_id, service_id=salon_id, date=day, time=start, status='pending'
+            ))
+            connection.execute(insert(NotificationOutbox).values(
+                user_id=salon_id, content='New appointment booking', type='new_appointment'
+            ))
+
+
+def worker(path, tuned, seconds, write_ratio, start_at, results):
+    engine = make_engine(path, tuned)
+    today = datetime.now().date()
+    latencies = {'read': [], 'write': []}
+    locked = 0
+
+    with engine.connect() as connection:
+        time.sleep(max(0, start_at - time.time()))
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            kind = 'write' if random.random() < write_ratio else 'read'
+            started = time.perf_counter()
+            try:
+                if kind == 'write':
+                    write(connection, today)
+                else:
+                    with connection.begin():
+                        read(connection, today)
+            except OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                locked += 1
+                continue
+            latencies[kind].append(time.perf_counter() - started)
+
+    results.put((latencies, locked))
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000
+
+
+def run(label, tuned, args):
+    path = os.path.join(scratch_dir, f"{label}.db")
+    seed(make_engine(path, tuned))
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    start_at = time.time() + 2
+    processes = [
+        context.Process(target=worker, args=(path, tuned, args.seconds, args.write_ratio, start_at, results))
+        for _ in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    reads = [latency for latencies, _ in outcomes for latency in latencies['read']]
+    writes = [latency for latencies, _ in outcomes for latency in latencies['write']]
+    locked = sum(count for _, count in outcomes)
+    print(
+        f"{label:8} ops/s={(len(reads) + len(writes)) / args.seconds:8.1f} "
+        f"reads/s={len(reads) / args.seconds:8.1f} writes/s={len(writes) / args.seconds:7.1f} "
+        f"read p50/p99={percentile(reads, 0.5):.2f}/{percentile(reads, 0.99):.2f}ms "
+        f"write p50/p99={percentile(writes, 0.5):.2f}/{percentile(writes, 0.99):.2f}ms "
+        f"locked={locked}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=8, help='worker processes sharing the database')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f"workers={args.workers} seconds={args.seconds} write_ratio={args.write_ratio}")
+    run('default', False, args)
+    run('tuned', True, args)
+
+
+if __name__ == '__main__':
+    main()
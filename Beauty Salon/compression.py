@@ -0,0 +1,71 @@
+"""On-the-fly compression of HTML and JSON responses.
+
+Bundled assets are precompressed at build time; rendered pages and API
+responses are compressed here, after the request, with brotli when the client
+accepts it and the brotli package is installed, and gzip otherwise. The page
+cache compresses pages itself before storing them, so a cache hit is served
+as stored instead of being compressed again.
+"""
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Compress:
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_ENABLED', True)
+        app.config.setdefault('COMPRESS_MIMETYPES', ('text/html', 'application/json'))
+        app.config.setdefault('COMPRESS_MIN_SIZE', 500)  # bytes; smaller bodies are not worth it
+        app.config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+        app.config.setdefault('COMPRESS_BROTLI_QUALITY', 4)
+
+        self.app = app
+        app.extensions['compress'] = self
+        app.after_request(self.compress)
+
+    def compress(self, response):
+        config = self.app.config
+        if (
+            not config['COMPRESS_ENABLED']
+            or response.status_code != 200
+            or response.mimetype not in config['COMPRESS_MIMETYPES']
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+        ):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        body = response.get_data()
+        if len(body) < config['COMPRESS_MIN_SIZE']:
+            return response
+
+        encoding = self.negotiate()
+        if encoding == 'br':
+            response.set_data(brotli.compress(body, quality=config['COMPRESS_BROTLI_QUALITY']))
+            response.headers['Content-Encoding'] = 'br'
+        elif encoding == 'gzip':
+            response.set_data(gzip.compress(body, config['COMPRESS_GZIP_LEVEL']))
+            response.headers['Content-Encoding'] = 'gzip'
+
+        return response
+
+    def negotiate(self):
+        # The encoding this request's compressible responses get, or None for none
+        if not self.app.config['COMPRESS_ENABLED']:
+            return None
+        if brotli is not None and 'br' in request.accept_encodings:
+            return 'br'
+        if 'gzip' in request.accept_encodings:
+            return 'gzip'
+        return None
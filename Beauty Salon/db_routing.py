@@ -0,0 +1,87 @@
+"""Optional read replica for read-only routes.
+
+When a replica bind is configured, routes wrapped with ReadReplica.route send
+their SELECTs to it; everything else, and every flush, still goes to the
+primary. After a request commits, the browser is pinned to the primary for
+READ_YOUR_WRITES_SECONDS, so a user never sees a page from before their own
+change while the replica catches up.
+"""
+import sqlite3
+from functools import wraps
+from time import time
+
+from flask import current_app, g, has_app_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, event
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and isinstance(clause, Select) and has_app_context() and g.get('use_replica'):
+            engine = current_app.extensions['read_replica'].engine
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReadReplica:
+    def __init__(self, app=None, db=None):
+        self.app = None
+        self.db = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault('READ_REPLICA_BIND', 'replica')
+        app.config.setdefault('READ_YOUR_WRITES_SECONDS', 5)
+
+        self.app = app
+        self.db = db
+        app.extensions['read_replica'] = self
+        event.listen(RoutingSession, 'after_commit', self._after_commit)
+        app.after_request(self._pin_after_write)
+
+    @property
+    def engine(self):
+        bind = self.app.config['READ_REPLICA_BIND']
+        if bind not in (self.app.config.get('SQLALCHEMY_BINDS') or {}):
+            return None
+        return self.db.engines[bind]
+
+    def _after_commit(self, db_session):
+        if has_app_context():
+            g.committed_to_primary = True
+
+    def _pin_after_write(self, response):
+        if g.get('committed_to_primary') and self.engine is not None:
+            session['_primary_until'] = time() + self.app.config['READ_YOUR_WRITES_SECONDS']
+        return response
+
+    def route(self, view):
+        # Serve this view's reads from the replica, unless the browser wrote recently
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            g.use_replica = (
+                self.engine is not None
+                and request.method == 'GET'
+                and session.get('_primary_until', 0) < time()
+            )
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    def sync_sqlite(self):
+        # Copy the primary into the replica file, for trying the split locally with SQLite
+        primary = self.db.engine
+        replica = self.engine
+        if replica is None or primary.dialect.name != 'sqlite' or replica.dialect.name != 'sqlite':
+            raise RuntimeError('Syncing needs a SQLite primary and a SQLite replica bind.')
+
+        source = sqlite3.connect(primary.url.database)
+        target = sqlite3.connect(replica.url.database)
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
+        replica.dispose()
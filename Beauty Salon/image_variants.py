@@ -0,0 +1,147 @@
+"""Resized and WebP variants of uploaded images.
+
+Uploads are stored at full size. A background thread writes smaller copies of
+each one (a square thumbnail, a listing card and a gallery size), each in WebP
+and in a JPEG or PNG fallback, under uploads/variants. Templates call
+responsive_image(), which serves the best variant that already exists and
+falls back to the original until the worker has caught up. Without Pillow
+installed no variants are made and the originals are served as before.
+"""
+import os
+import queue
+import threading
+
+from flask import url_for
+from markupsafe import Markup, escape
+
+from per_process import PerProcess
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+
+class ImageVariants(PerProcess):
+    def __init__(self, app=None, bump=None):
+        self.app = None
+        self.bump = None
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, bump)
+
+    def init_app(self, app, bump=None):
+        app.config.setdefault('IMAGE_VARIANTS_ENABLED', Image is not None)
+        # Bounding boxes; images are scaled down to fit and never enlarged
+        app.config.setdefault('IMAGE_VARIANT_SIZES', {
+            'thumb': (200, 200),
+            'card': (640, 480),
+            'detail': (1280, 960),
+        })
+        app.config.setdefault('IMAGE_VARIANT_QUALITY', 80)
+
+        self.app = app
+        self.bump = bump
+        app.extensions['image_variants'] = self
+        app.jinja_env.globals['responsive_image'] = self.responsive_image
+
+    def variant_path(self, image_path, size, extension):
+        # uploads/abc.jpg -> uploads/variants/abc.jpg_card.webp. The whole file name is kept,
+        # so abc.jpg and abc.png never share variants and removing one leaves the other's
+        directory, filename = os.path.split(image_path)
+        return f"{directory}/variants/{filename}_{size}.{extension}"
+
+    def static_file(self, path):
+        return os.path.join(self.app.static_folder, path)
+
+    def find_variant(self, image_path, size, extensions):
+        for extension in extensions:
+            path = self.variant_path(image_path, size, extension)
+            if os.path.exists(self.static_file(path)):
+                return path
+        return None
+
+    def responsive_image(self, image_path, size, alt='', **attrs):
+        # <picture> with a WebP source when the variants exist, else the original <img>
+        fallback = self.find_variant(image_path, size, ('jpg', 'png')) or image_path
+        webp = self.find_variant(image_path, size, ('webp',))
+
+        attributes = ''.join(f' {name.replace("_", "-")}="{escape(value)}"' for name, value in attrs.items())
+        img = (
+            f'<img src="{escape(url_for("static", filename=fallback))}" alt="{escape(alt)}" '
+            f'loading="lazy" decoding="async"{attributes}>'
+        )
+        if webp is None:
+            return Markup(img)
+
+        return Markup(
+            f'<picture><source srcset="{escape(url_for("static", filename=webp))}" type="image/webp">{img}</picture>'
+        )
+
+    def _enabled(self):
+        return self.app.config['IMAGE_VARIANTS_ENABLED']
+
+    def _start(self):
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name='image-variants', daemon=True).start()
+
+    def enqueue(self, image_path, scopes=()):
+        # scopes are page cache scopes to bump once the variants are on disk
+        if not self.app.config['IMAGE_VARIANTS_ENABLED']:
+            return
+        self.ensure_started()
+        self._queue.put((image_path, tuple(scopes)))
+
+    def generate(self, image_path):
+        # Write every variant of one upload; returns the number of files written
+        try:
+            with Image.open(self.static_file(image_path)) as original:
+                if getattr(original, 'is_animated', False):
+                    return 0
+                image = ImageOps.exif_transpose(original)
+                image.load()
+        except (OSError, ValueError):
+            # Not a raster image Pillow can read (an SVG logo, a truncated upload)
+            return 0
+
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        quality = self.app.config['IMAGE_VARIANT_QUALITY']
+
+        written = 0
+        for size, box in self.app.config['IMAGE_VARIANT_SIZES'].items():
+            resized = image.copy()
+            resized.thumbnail(box, Image.LANCZOS)
+
+            fallback = ('png', 'PNG', {'optimize': True}) if has_alpha else \
+                ('jpg', 'JPEG', {'quality': quality, 'optimize': True, 'progressive': True})
+            for extension, image_format, options in (('webp', 'WEBP', {'quality': quality, 'method': 6}), fallback):
+                path = self.static_file(self.variant_path(image_path, size, extension))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write then rename, so a page never links a half-written file
+                temp_path = f"{path}.{os.getpid()}.tmp"
+                resized.save(temp_path, image_format, **options)
+                os.replace(temp_path, path)
+                written += 1
+
+        return written
+
+    def remove(self, image_path):
+        # Delete every variant of an upload that is being garbage collected
+        for size in self.app.config['IMAGE_VARIANT_SIZES']:
+            for extension in ('webp', 'jpg', 'png'):
+                try:
+                    os.remove(self.static_file(self.variant_path(image_path, size, extension)))
+                except FileNotFoundError:
+                    pass
+
+    def _run(self):
+        while True:
+            image_path, scopes = self._queue.get()
+            try:
+                if self.generate(image_path) and scopes and self.bump is not None:
+                    with self.app.app_context():
+                        self.bump(*scopes)
+            except Exception as e:
+                self.app.logger.error(f"Error generating variants for {image_path}: {str(e)}")
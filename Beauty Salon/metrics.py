@@ -0,0 +1,244 @@
+"""Per-route request metrics and a slow-query log.
+
+SQLAlchemy engine events count every statement and the time spent in the
+database. The counts are added to the current request, and at the end of the
+request they go into per-route histograms of latency, query count and
+database time. Any statement slower than SLOW_QUERY_THRESHOLD_MS is logged
+with its route and bound parameters.
+
+Each worker process writes its histograms to instance/metrics/<pid>.json
+every few seconds. /metrics adds up the files of all workers, the current
+one live, and serves them in the Prometheus text format. Files of workers
+that have exited are kept, so totals never go backwards.
+
+/metrics answers only requests from METRICS_ALLOWED_ADDRESSES and, when
+METRICS_TOKEN is set, only those sending it as "Authorization: Bearer <token>".
+Behind a reverse proxy on the same host every request arrives from 127.0.0.1,
+so the address list lets everyone through; set METRICS_TOKEN there, or block
+/metrics at the proxy.
+"""
+import glob
+import hmac
+import json
+import os
+import reprlib
+import threading
+from time import monotonic, perf_counter
+
+from flask import abort, g, has_request_context, request
+from sqlalchemy import event
+
+from per_process import PerProcess
+
+HISTOGRAMS = {
+    'request_duration_seconds': (
+        'Time to handle a request, by route.',
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    ),
+    'request_queries': (
+        'SQL statements run by a request, by route.',
+        (0, 1, 2, 3, 5, 10, 20, 50, 100),
+    ),
+    'request_database_seconds': (
+        'Time a request spent waiting for the database, by route.',
+        (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+    ),
+}
+
+
+# Bound parameters are logged through a size-limited repr, which stops after the
+# first few rows and characters instead of building the whole text and cutting it
+_parameters_repr = reprlib.Repr()
+_parameters_repr.maxlevel = 3
+_parameters_repr.maxlist = _parameters_repr.maxtuple = _parameters_repr.maxdict = 20
+_parameters_repr.maxstring = 200
+_parameters_repr.maxother = 100
+
+
+class Metrics(PerProcess):
+    def __init__(self, app=None, db=None):
+        self.app = None
+        self._histograms = {}  # name -> endpoint -> [count per bucket..., count above the last, sum]
+        self._slow_queries = {}  # endpoint -> count
+        self._lock = threading.Lock()
+        self._written_at = 0
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_DIR', os.path.join(app.instance_path, 'metrics'))
+        app.config.setdefault('METRICS_WRITE_INTERVAL', 5.0)  # seconds between writes of this worker's file
+        # Addresses allowed to read /metrics; None allows everyone
+        app.config.setdefault('METRICS_ALLOWED_ADDRESSES', ('127.0.0.1', '::1'))
+        # Bearer token /metrics also requires; None requires none
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', 100)
+        app.config.setdefault('SLOW_QUERY_LOG_PARAMETERS', True)
+
+        self.app = app
+        app.extensions['metrics'] = self
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self.serve)
+
+        with app.app_context():
+            engines = list(db.engines.values())
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._before_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_execute)
+            event.listen(engine, 'handle_error', self._execute_failed)
+
+    def _before_execute(self, connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault('query_started', []).append(perf_counter())
+
+    def _execute_failed(self, exception_context):
+        started = exception_context.connection.info.get('query_started') if exception_context.connection else None
+        if started:
+            started.pop()
+
+    def _after_execute(self, connection, cursor, statement, parameters, context, executemany):
+        elapsed = perf_counter() - connection.info['query_started'].pop()
+
+        if has_request_context() and 'metrics_started' in g:
+            g.metrics_queries += 1
+            g.metrics_database_time += elapsed
+            route = request.endpoint or 'unmatched'
+        else:
+            route = threading.current_thread().name
+
+        threshold = self.app.config['SLOW_QUERY_THRESHOLD_MS']
+        if threshold is not None and elapsed * 1000 >= threshold:
+            self.ensure_started()
+            with self._lock:
+                self._slow_queries[route] = self._slow_queries.get(route, 0) + 1
+            message = f"Slow query ({elapsed * 1000:.1f} ms) in {route}: {' '.join(statement.split())}"
+            if self.app.config['SLOW_QUERY_LOG_PARAMETERS']:
+                message += f" parameters={_parameters_repr.repr(parameters)}"
+                if executemany:
+                    message += f" ({len(parameters)} rows)"
+            self.app.logger.warning(message)
+
+    def _start_request(self):
+        if self.app.config['METRICS_ENABLED']:
+            g.metrics_started = perf_counter()
+            g.metrics_queries = 0
+            g.metrics_database_time = 0.0
+
+    def _finish_request(self, response):
+        if 'metrics_started' not in g or request.endpoint == 'metrics':
+            return response
+
+        # Streamed responses (the event stream) are timed up to their first byte
+        route = request.endpoint or 'unmatched'
+        self.ensure_started()
+        with self._lock:
+            self._observe('request_duration_seconds', route, perf_counter() - g.metrics_started)
+            self._observe('request_queries', route, g.metrics_queries)
+            self._observe('request_database_seconds', route, g.metrics_database_time)
+
+        if monotonic() - self._written_at >= self.app.config['METRICS_WRITE_INTERVAL']:
+            self._written_at = monotonic()
+            try:
+                self.write()
+            except OSError as e:
+                self.app.logger.error(f"Error writing request metrics: {str(e)}")
+        return response
+
+    def _start(self):
+        # A forked worker starts from zero; the parent's numbers are in the parent's file
+        self._histograms = {}
+        self._slow_queries = {}
+        self._written_at = 0
+
+    def _observe(self, name, route, value):
+        buckets = HISTOGRAMS[name][1]
+        counts = self._histograms.setdefault(name, {}).setdefault(route, [0] * (len(buckets) + 2))
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[len(buckets)] += 1
+        counts[-1] += value
+
+    def _snapshot(self):
+        self.ensure_started()
+        with self._lock:
+            return {
+                'histograms': {name: {route: list(counts) for route, counts in routes.items()}
+                               for name, routes in self._histograms.items()},
+                'slow_queries': dict(self._slow_queries),
+            }
+
+    def write(self):
+        # Replace this worker's file with its current totals
+        directory = self.app.config['METRICS_DIR']
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w') as metrics_file:
+            json.dump(self._snapshot(), metrics_file)
+        os.replace(temp_path, path)
+
+    def collect(self):
+        # Totals over every worker's file, with this worker's own numbers taken live
+        snapshots = [self._snapshot()]
+        own_file = f"{os.getpid()}.json"
+        for path in glob.glob(os.path.join(self.app.config['METRICS_DIR'], '*.json')):
+            if os.path.basename(path) == own_file:
+                continue
+            try:
+                with open(path) as metrics_file:
+                    snapshots.append(json.load(metrics_file))
+            except (OSError, ValueError):
+                continue
+
+        histograms, slow_queries = {}, {}
+        for snapshot in snapshots:
+            for name, routes in snapshot['histograms'].items():
+                for route, counts in routes.items():
+                    total = histograms.setdefault(name, {}).setdefault(route, [0] * len(counts))
+                    for i, value in enumerate(counts):
+                        total[i] += value
+            for route, count in snapshot['slow_queries'].items():
+                slow_queries[route] = slow_queries.get(route, 0) + count
+        return histograms, slow_queries
+
+    def render(self):
+        histograms, slow_queries = self.collect()
+        lines = []
+        for name, (description, buckets) in HISTOGRAMS.items():
+            metric = f"salon_{name}"
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} histogram"]
+            for route, counts in sorted(histograms.get(name, {}).items()):
+                label = f'endpoint="{_escape(route)}"'
+                cumulative = 0
+                for bound, count in zip(buckets, counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {cumulative}')
+                cumulative += counts[len(buckets)]
+                lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {cumulative}')
+                lines.append(f'{metric}_sum{{{label}}} {counts[-1]}')
+                lines.append(f'{metric}_count{{{label}}} {cumulative}')
+
+        lines += ['# HELP salon_slow_queries_total Statements slower than the slow-query threshold, by route.',
+                  '# TYPE salon_slow_queries_total counter']
+        for route, count in sorted(slow_queries.items()):
+            lines.append(f'salon_slow_queries_total{{endpoint="{_escape(route)}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self):
+        allowed = self.app.config['METRICS_ALLOWED_ADDRESSES']
+        if allowed is not None and request.remote_addr not in allowed:
+            abort(404)
+        token = self.app.config['METRICS_TOKEN']
+        if token is not None:
+            scheme, _, sent = request.headers.get('Authorization', '').partition(' ')
+            if scheme.lower() != 'bearer' or not hmac.compare_digest(sent.encode(), str(token).encode()):
+                abort(404)
+        return self.app.response_class(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
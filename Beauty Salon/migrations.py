@@ -0,0 +1,123 @@
+"""Versioned schema migrations for the salon database.
+
+db.create_all() only creates missing tables, so columns and indexes added after a
+database was first created are applied here, in order, exactly once. Every
+migration is written to be harmless on a database that create_all() has just
+built at the latest schema.
+"""
+from datetime import datetime, time
+
+from sqlalchemy import Integer, Time, bindparam, column, inspect, select, table, text, update
+
+
+def _add_rating_counters(connection):
+    salon_columns = [column['name'] for column in inspect(connection).get_columns('salon')]
+    if 'rating_sum' in salon_columns:
+        return
+
+    connection.execute(text("ALTER TABLE salon ADD COLUMN rating_sum INTEGER NOT NULL DEFAULT 0"))
+    connection.execute(text("ALTER TABLE salon ADD COLUMN rating_count INTEGER NOT NULL DEFAULT 0"))
+    connection.execute(text(
+        "UPDATE salon SET "
+        "rating_sum = (SELECT coalesce(sum(review.rating), 0) FROM review WHERE review.salon_id = salon.id), "
+        "rating_count = (SELECT count(*) FROM review WHERE review.salon_id = salon.id)"
+    ))
+
+
+# Kept identical to the db.Index declarations on the models
+HOT_QUERY_INDEXES = [
+    ('ix_time_slot_salon_date_available_start', 'time_slot', ['salon_id', 'date', 'is_available', 'start_time']),
+    ('ix_appointment_salon_status', 'appointment', ['salon_id', 'status']),
+    ('ix_appointment_customer_date_time', 'appointment', ['customer_id', 'date', 'time']),
+    ('ix_notification_user_read_timestamp', 'notification', ['user_id', 'is_read', 'timestamp']),
+    ('ix_review_salon_date_posted', 'review', ['salon_id', 'date_posted']),
+    ('ix_salon_owner_id', 'salon', ['owner_id']),
+    ('ix_service_salon_price', 'service', ['salon_id', 'price']),
+    ('ix_service_name_salon', 'service', ['name', 'salon_id']),
+    ('ix_salon_image_salon_id', 'salon_image', ['salon_id']),
+]
+
+
+def _add_hot_query_indexes(connection):
+    for name, table, columns in HOT_QUERY_INDEXES:
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+
+def _add_upload_released_at(connection):
+    blob_columns = [column['name'] for column in inspect(connection).get_columns('upload_blob')]
+    if 'released_at' in blob_columns:
+        return
+
+    connection.execute(text("ALTER TABLE upload_blob ADD COLUMN released_at DATETIME"))
+
+
+def _add_appointment_end_time(connection):
+    appointment_columns = [column['name'] for column in inspect(connection).get_columns('appointment')]
+    if 'end_time' in appointment_columns:
+        return
+
+    connection.execute(text("ALTER TABLE appointment ADD COLUMN end_time TIME"))
+
+    # Typed table stubs, so times are read and written in the dialect's own format
+    appointment = table('appointment', column('id', Integer), column('service_id', Integer),
+                        column('time', Time), column('end_time', Time))
+    service = table('service', column('id', Integer), column('duration', Integer))
+
+    # The current service duration is the best record left of what was reserved;
+    # an appointment running to midnight keeps a NULL end, meaning the end of the day
+    ends = []
+    for appointment_id, start, duration in connection.execute(
+        select(appointment.c.id, appointment.c.time, service.c.duration)
+        .join(service, service.c.id == appointment.c.service_id)
+    ):
+        end_minutes = start.hour * 60 + start.minute + duration
+        if end_minutes < 24 * 60:
+            ends.append({'appointment_id': appointment_id, 'end': time(end_minutes // 60, end_minutes % 60)})
+
+    if ends:
+        connection.execute(
+            update(appointment).where(appointment.c.id == bindparam('appointment_id')).values(end_time=bindparam('end')),
+            ends
+        )
+
+
+MIGRATIONS = [
+    (1, 'Add salon rating counters', _add_rating_counters),
+    (2, 'Add composite indexes for hot queries', _add_hot_query_indexes),
+    (3, 'Record when uploads were last released', _add_upload_released_at),
+    # Creates the indexes added to HOT_QUERY_INDEXES since migration 2; the others already exist
+    (4, 'Add service name index', _add_hot_query_indexes),
+    (5, 'Record where each appointment ends', _add_appointment_end_time),
+]
+
+
+def upgrade(engine):
+    # Apply every migration newer than the database and return the versions that ran
+    applied_now = []
+
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, description VARCHAR(200), applied_at DATETIME)"
+        ))
+        applied = {row[0] for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+
+        for version, description, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+
+            migrate(connection)
+            connection.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:version, :description, :applied_at)"),
+                {'version': version, 'description': description, 'applied_at': datetime.utcnow()}
+            )
+            applied_now.append(version)
+
+    return applied_now
+
+
+def current_version(engine):
+    with engine.connect() as connection:
+        if not inspect(connection).has_table('schema_migrations'):
+            return 0
+        return connection.execute(text("SELECT coalesce(max(version), 0) FROM schema_migrations")).scalar()
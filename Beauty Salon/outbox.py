@@ -0,0 +1,59 @@
+"""Background delivery for the notification outbox.
+
+Routes only add outbox rows to their own transaction, so a booking commits once.
+This worker wakes up when a request signals it (or every poll interval, which
+also picks up rows left over from a crash) and moves the outbox into the
+notification table in batches.
+"""
+import threading
+
+from per_process import PerProcess
+
+
+class OutboxWorker(PerProcess):
+    def __init__(self, app=None, deliver=None):
+        self.app = None
+        self.deliver = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, deliver)
+
+    def init_app(self, app, deliver):
+        app.config.setdefault('OUTBOX_WORKER_ENABLED', True)
+        app.config.setdefault('OUTBOX_BATCH_SIZE', 200)
+        app.config.setdefault('OUTBOX_POLL_INTERVAL', 5.0)  # seconds
+
+        self.app = app
+        self.deliver = deliver
+        app.extensions['outbox_worker'] = self
+
+    def _enabled(self):
+        return self.app.config['OUTBOX_WORKER_ENABLED']
+
+    def _start(self):
+        self._wake = threading.Event()
+        threading.Thread(target=self._run, name='notification-outbox', daemon=True).start()
+
+    def notify(self):
+        self._wake.set()
+
+    def drain(self):
+        # Deliver everything that is queued right now; returns the number of rows moved
+        batch_size = self.app.config['OUTBOX_BATCH_SIZE']
+        delivered = 0
+        with self.app.app_context():
+            while True:
+                count = self.deliver(batch_size)
+                delivered += count
+                if count < batch_size:
+                    return delivered
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.app.config['OUTBOX_POLL_INTERVAL'])
+            self._wake.clear()
+            try:
+                self.drain()
+            except Exception as e:
+                self.app.logger.error(f"Error delivering notification outbox: {str(e)}")
@@ -0,0 +1,78 @@
+"""Password hashing on a small, bounded pool of threads.
+
+Hashes are slow on purpose, so a burst of logins can take every CPU the
+request workers need for bookings. Hashing runs on PASSWORD_HASH_WORKERS
+threads per process instead; the hash functions release the GIL while they
+work, so the pool caps how many cores hashing uses at once. At most
+PASSWORD_HASH_QUEUE_SIZE more requests wait for a thread. Any beyond that,
+or any that wait longer than PASSWORD_HASH_TIMEOUT, get HashingBusy and can
+be told to retry.
+
+PASSWORD_HASH_METHOD takes any method werkzeug accepts, with its cost, e.g.
+"scrypt:32768:8:1" or "pbkdf2:sha256:1000000". Stored hashes made with other
+parameters are reported by needs_rehash(), so login can upgrade them.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from per_process import PerProcess
+
+
+class HashingBusy(Exception):
+    pass
+
+
+class PasswordHasher(PerProcess):
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._method_prefix = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+        app.config.setdefault('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2))
+        app.config.setdefault('PASSWORD_HASH_QUEUE_SIZE', 32)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10.0)  # seconds, queueing included
+
+        self.app = app
+        app.extensions['password_hasher'] = self
+
+    def _start(self):
+        workers = self.app.config['PASSWORD_HASH_WORKERS']
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + self.app.config['PASSWORD_HASH_QUEUE_SIZE'])
+
+    def _run(self, function, *args):
+        self.ensure_started()
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy('Password hashing queue is full.')
+
+        future = self._executor.submit(function, *args)
+        future.add_done_callback(lambda future: self._slots.release())
+        try:
+            return future.result(timeout=self.app.config['PASSWORD_HASH_TIMEOUT'])
+        except TimeoutError:
+            # The done callback frees the slot once the hash finishes or is cancelled
+            future.cancel()
+            raise HashingBusy('Password hashing timed out.')
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.app.config['PASSWORD_HASH_METHOD'])
+
+    def verify(self, stored_hash, password):
+        return self._run(check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        # werkzeug expands a bare method name ("scrypt") to its full parameters
+        # in the stored prefix, so compare against a prefix it wrote itself
+        if self._method_prefix is None:
+            method = self.app.config['PASSWORD_HASH_METHOD']
+            self._method_prefix = method if method.count(':') >= 2 else self.hash('').split('$', 1)[0]
+        return stored_hash.split('$', 1)[0] != self._method_prefix
@@ -0,0 +1,29 @@
+"""Per-process start-up for extensions that own threads, pools or sockets.
+
+None of those survive fork: a pre-forked worker inherits the parent's objects
+but not its threads. ensure_started() runs an extension's _start() once in
+every process that uses it, on first use there, so the app can be imported
+and forked freely before anything starts.
+"""
+import os
+
+
+class PerProcess:
+    # Subclasses create self._lock in __init__ and implement _start()
+    _pid = None
+
+    def ensure_started(self):
+        if self._pid == os.getpid() or not self._enabled():
+            return
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+                # Set last, so callers that skip the lock only see a finished start
+                self._pid = os.getpid()
+
+    def _enabled(self):
+        return True
+
+    def _start(self):
+        raise NotImplementedError
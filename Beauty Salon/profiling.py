@@ -0,0 +1,178 @@
+"""Opt-in sampling profiler for slow routes.
+
+A profiled request registers its thread with a sampler thread, which records
+the thread's stack every PROFILER_INTERVAL_MS. When the request ends, the
+samples are written in collapsed-stack format, one "frame;frame;frame count"
+line per distinct stack. flamegraph.pl, speedscope and similar tools turn
+these files into flame graphs. Files go to instance/profiles/<route>/, and
+each route keeps only its newest PROFILER_FILES_PER_ROUTE files.
+
+Which requests are profiled:
+  * with PROFILER_ENABLED, a PROFILER_SAMPLE_RATE fraction of all requests;
+  * with PROFILER_ENABLED and PROFILER_SLOW_THRESHOLD_MS set, every request
+    is sampled, and it is kept if it took at least that long;
+  * any request carrying a valid signed PROFILER_HEADER token (from
+    `flask profile-token`), even with profiling disabled.
+
+Otherwise each request costs a config lookup and a header lookup. The sampler
+thread only wakes while a profiled request is running.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from time import perf_counter, time_ns
+
+from flask import g, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from per_process import PerProcess
+
+
+class Profiler(PerProcess):
+    def __init__(self, app=None):
+        self.app = None
+        self._profiles = {}  # thread id -> Counter of collapsed stacks
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PROFILER_ENABLED', False)
+        app.config.setdefault('PROFILER_SAMPLE_RATE', 0.01)
+        app.config.setdefault('PROFILER_SLOW_THRESHOLD_MS', None)
+        app.config.setdefault('PROFILER_INTERVAL_MS', 5)
+        app.config.setdefault('PROFILER_DIR', os.path.join(app.instance_path, 'profiles'))
+        app.config.setdefault('PROFILER_FILES_PER_ROUTE', 20)
+        app.config.setdefault('PROFILER_HEADER', 'X-Profile-Token')
+        app.config.setdefault('PROFILER_TOKEN_MAX_AGE', 3600)  # seconds
+
+        self.app = app
+        app.extensions['profiler'] = self
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._abandon_request)
+
+    def _serializer(self):
+        return URLSafeTimedSerializer(self.app.config['SECRET_KEY'], salt='profiler')
+
+    def make_token(self):
+        return self._serializer().dumps('profile')
+
+    def _has_valid_token(self):
+        token = request.headers.get(self.app.config['PROFILER_HEADER'])
+        if not token:
+            return False
+        try:
+            self._serializer().loads(token, max_age=self.app.config['PROFILER_TOKEN_MAX_AGE'])
+            return True
+        except BadSignature:
+            return False
+
+    def _start_request(self):
+        config = self.app.config
+        requested = self._has_valid_token()
+        if not requested and not config['PROFILER_ENABLED']:
+            return
+
+        # Slow requests are only known at the end, so with a threshold every request is sampled
+        sampled = random.random() < config['PROFILER_SAMPLE_RATE']
+        if not (requested or sampled or config['PROFILER_SLOW_THRESHOLD_MS'] is not None):
+            return
+
+        self.ensure_started()
+        g.profile_started = perf_counter()
+        g.profile_keep = requested or sampled
+        g.profile_requested = requested
+        with self._lock:
+            self._profiles[threading.get_ident()] = Counter()
+            self._active.set()
+
+    def _stop(self):
+        with self._lock:
+            return self._profiles.pop(threading.get_ident(), None)
+
+    def _finish_request(self, response):
+        if 'profile_started' not in g:
+            return response
+
+        samples = self._stop()
+        duration_ms = (perf_counter() - g.pop('profile_started')) * 1000
+        threshold = self.app.config['PROFILER_SLOW_THRESHOLD_MS']
+        if samples and (g.profile_keep or (threshold is not None and duration_ms >= threshold)):
+            try:
+                path = self.write(request.endpoint or 'unmatched', duration_ms, samples)
+                if g.profile_requested:
+                    response.headers['X-Profile-File'] = os.path.relpath(path, self.app.config['PROFILER_DIR'])
+            except OSError as e:
+                self.app.logger.error(f"Error writing profile: {str(e)}")
+        return response
+
+    def _abandon_request(self, exception):
+        # Requests that ended in an unhandled error never reach _finish_request
+        if g.pop('profile_started', None) is not None:
+            self._stop()
+
+    def write(self, route, duration_ms, samples):
+        # Add a file to the route's ring buffer and drop the oldest beyond its size
+        directory = os.path.join(self.app.config['PROFILER_DIR'], route)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{time_ns()}-{duration_ms:.0f}ms.collapsed")
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as profile_file:
+            for stack, count in samples.most_common():
+                profile_file.write(f"{stack} {count}\n")
+        os.replace(temp_path, path)
+
+        profiles = sorted(name for name in os.listdir(directory) if name.endswith('.collapsed'))
+        for name in profiles[:-self.app.config['PROFILER_FILES_PER_ROUTE']]:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass  # another worker pruned it first
+        return path
+
+    def merged(self, route):
+        # Every kept profile of a route added together, for one flame graph
+        directory = os.path.join(self.app.config['PROFILER_DIR'], route)
+        totals = Counter()
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.collapsed'):
+                with open(os.path.join(directory, name)) as profile_file:
+                    for line in profile_file:
+                        stack, _, count = line.rstrip('\n').rpartition(' ')
+                        totals[stack] += int(count)
+        return totals
+
+    def _start(self):
+        self._profiles = {}
+        self._active = threading.Event()
+        threading.Thread(target=self._run, name='profiler-sampler', daemon=True).start()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            self._active.wait()
+            time.sleep(self.app.config['PROFILER_INTERVAL_MS'] / 1000)
+            frames = sys._current_frames()
+            with self._lock:
+                if not self._profiles:
+                    self._active.clear()
+                    continue
+                for thread_id, samples in self._profiles.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None and thread_id != own_id:
+                        samples[_collapse(frame)] += 1
+
+
+def _collapse(frame):
+    # Outermost frame first, as flame graph tools expect
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}")
+        frame = frame.f_back
+    return ';'.join(reversed(names)).replace(' ', '_')
@@ -0,0 +1,108 @@
+"""Local publish/subscribe for live updates.
+
+Subscribers are per-process queues keyed by topic. A publish is delivered to the
+local queues directly and broadcast to every other worker process over Unix
+datagram sockets in the instance folder, so the app needs no external broker.
+Where Unix sockets are unavailable, events only reach the publishing process.
+"""
+import glob
+import json
+import os
+import queue
+import socket
+import threading
+
+from per_process import PerProcess
+
+
+class PubSub(PerProcess):
+    def __init__(self, app=None):
+        self.app = None
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._socket = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PUBSUB_SOCKET_DIR', os.path.join(app.instance_path, 'pubsub'))
+        app.config.setdefault('PUBSUB_QUEUE_SIZE', 100)
+
+        self.app = app
+        app.extensions['pubsub'] = self
+
+    @property
+    def _socket_path(self):
+        return os.path.join(self.app.config['PUBSUB_SOCKET_DIR'], f"{os.getpid()}.sock")
+
+    def _start(self):
+        # One receiving socket per worker process, recreated after a fork
+        self._subscribers = {}
+        if not hasattr(socket, 'AF_UNIX'):
+            return
+
+        os.makedirs(self.app.config['PUBSUB_SOCKET_DIR'], exist_ok=True)
+        path = self._socket_path
+        if os.path.exists(path):
+            os.unlink(path)
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(path)
+        threading.Thread(target=self._receive, args=(self._socket,), name='pubsub-receiver', daemon=True).start()
+
+    def subscribe(self, topic):
+        self.ensure_started()
+        subscriber = queue.Queue(maxsize=self.app.config['PUBSUB_QUEUE_SIZE'])
+        with self._lock:
+            self._subscribers.setdefault(topic, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, topic, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(topic)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def publish(self, topic, event):
+        self.ensure_started()
+        self._deliver(topic, event)
+
+        if self._socket is None:
+            return
+
+        message = json.dumps({'topic': topic, 'event': event}).encode()
+        own_path = self._socket_path
+        for path in glob.glob(os.path.join(self.app.config['PUBSUB_SOCKET_DIR'], '*.sock')):
+            if path == own_path:
+                continue
+            try:
+                self._socket.sendto(message, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The process behind this socket is gone
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            except OSError as e:
+                self.app.logger.warning(f"Could not publish to {path}: {str(e)}")
+
+    def _deliver(self, topic, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # A stalled client loses events rather than blocking the publisher
+                pass
+
+    def _receive(self, sock):
+        while True:
+            try:
+                message = json.loads(sock.recv(65536))
+                self._deliver(message['topic'], message['event'])
+            except Exception as e:
+                self.app.logger.warning(f"Dropped pubsub message: {str(e)}")
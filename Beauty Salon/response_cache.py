@@ -0,0 +1,249 @@
+"""Versioned page cache for anonymous traffic.
+
+Rendered pages are stored in a per-process LRU keyed by the request path, the
+response encoding and the current version stamp of every scope the page
+depends on (a salon, or the whole catalog). Pages are stored already
+compressed, so a hit costs no compression. Write routes bump those stamps after they commit. Stamps live in small
+files under the instance folder, so every worker process sees a bump at once
+and a cache hit never needs a database query.
+
+The same stamps give every page an ETag and Last-Modified without rendering
+it, so a browser or proxy revalidating an unchanged page gets a 304.
+"""
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+from time import monotonic, time, time_ns
+
+from flask import current_app, g, request, session
+
+
+class LRUCache:
+    def __init__(self, max_bytes, max_entries):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry, size):
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[0]
+
+            self._entries[key] = (size,) + entry
+            self.size += size
+
+            # Evict least recently used pages until both limits hold
+            while self.size > self.max_bytes or len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class PageCache:
+    def __init__(self, app=None):
+        self.pages = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PAGE_CACHE_ENABLED', True)
+        app.config.setdefault('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+        app.config.setdefault('PAGE_CACHE_MAX_ENTRIES', 2048)
+        app.config.setdefault('PAGE_CACHE_VERSION_DIR', os.path.join(app.instance_path, 'cache_versions'))
+
+        app.config.setdefault('CONDITIONAL_GET_ENABLED', True)
+        # How far a read replica may trail the primary; see _replica_may_lag
+        app.config.setdefault('PAGE_CACHE_REPLICA_LAG_SECONDS', 5)
+
+        os.makedirs(app.config['PAGE_CACHE_VERSION_DIR'], exist_ok=True)
+        self.pages = LRUCache(app.config['PAGE_CACHE_MAX_BYTES'], app.config['PAGE_CACHE_MAX_ENTRIES'])
+        self.code_version = self._code_version(app)
+        app.extensions['page_cache'] = self
+
+    def _code_version(self, app):
+        # Newest template or module, so a deploy invalidates ETags of pages no write has bumped
+        newest = 0
+        for folder in (app.root_path, os.path.join(app.root_path, app.template_folder or 'templates')):
+            for entry in os.scandir(folder):
+                if entry.name.endswith(('.py', '.html')):
+                    newest = max(newest, entry.stat().st_mtime)
+        return newest
+
+    def _version_path(self, scope):
+        return os.path.join(current_app.config['PAGE_CACHE_VERSION_DIR'], scope)
+
+    def version(self, scope):
+        try:
+            with open(self._version_path(scope)) as version_file:
+                return version_file.read()
+        except FileNotFoundError:
+            return '0'
+
+    def bump(self, *scopes):
+        # A fresh unique stamp rather than an increment, so two concurrent bumps
+        # from different processes can never collapse into the same version
+        for scope in scopes:
+            path = self._version_path(scope)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+            with open(temp_path, 'w') as version_file:
+                version_file.write(f"{time_ns()}-{uuid.uuid4().hex[:8]}")
+            os.replace(temp_path, path)
+
+    def _stamp_time(self, version):
+        # Stamps start with the time of the bump in nanoseconds
+        stamp = version.split('-', 1)[0]
+        return int(stamp) / 1e9 if stamp.isdigit() and stamp != '0' else None
+
+    def _replica_may_lag(self, versions):
+        # A page read from a replica just after a bump may predate the write,
+        # so it must not be stored or validated under the new version
+        if not g.get('use_replica'):
+            return False
+        recent = time() - current_app.config['PAGE_CACHE_REPLICA_LAG_SECONDS']
+        return any((self._stamp_time(version) or 0) > recent for version in versions)
+
+    def conditional(self, scopes, ttl=None):
+        # Answer revalidation with a 304 when none of the page's scopes changed.
+        # Logged-in pages also depend on the user's own scope and on the age of the
+        # CSRF tokens they embed; ttl pages change every ttl seconds regardless.
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if (
+                    not current_app.config['CONDITIONAL_GET_ENABLED']
+                    or request.method != 'GET'
+                    or '_flashes' in session
+                    or ('remember_token' in request.cookies and '_user_id' not in session)
+                ):
+                    return view(*args, **kwargs)
+
+                user_id = session.get('_user_id')
+                names = list(scopes(**kwargs))
+                if user_id:
+                    names.append(f'user-{user_id}')
+                versions = [(name, self.version(name)) for name in names]
+
+                now = time()
+                changed = [self.code_version] + [self._stamp_time(version) or 0 for _, version in versions]
+                for period in (ttl, user_id and current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600) / 2):
+                    if period:
+                        changed.append(now - now % period)
+
+                etag = hashlib.sha1(repr((request.endpoint, request.full_path, user_id, versions, changed)).encode()).hexdigest()
+                # Last-Modified has whole seconds, so two changes within one second share a
+                # date. It is only sent, and only trusted, once the newest change is a full
+                # second old, so any later change gets a later date; until then the
+                # ETag, which has the exact version stamps, is the only validator
+                newest = max(changed)
+                last_modified = datetime.fromtimestamp(int(newest), timezone.utc) if now - newest >= 1 else None
+
+                def finish(response):
+                    response.set_etag(etag, weak=True)
+                    if last_modified:
+                        response.last_modified = last_modified
+                    response.cache_control.no_cache = True
+                    response.cache_control.private = bool(user_id) or None
+                    response.vary.update(('Cookie', 'Accept-Encoding'))
+                    return response
+
+                if request.if_none_match:
+                    not_modified = request.if_none_match.contains_weak(etag)
+                else:
+                    not_modified = (
+                        last_modified is not None
+                        and request.if_modified_since is not None
+                        and last_modified <= request.if_modified_since
+                    )
+                if not_modified:
+                    return finish(current_app.response_class(status=304))
+
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not self._replica_may_lag(version for _, version in versions):
+                    finish(response)
+                return response
+
+            return wrapper
+
+        return decorator
+
+    def is_cacheable_request(self):
+        # Only plain anonymous GETs: no logged-in or remembered user, no pending flash messages
+        return (
+            current_app.config['PAGE_CACHE_ENABLED']
+            and request.method == 'GET'
+            and '_user_id' not in session
+            and '_flashes' not in session
+            and 'remember_token' not in request.cookies
+        )
+
+    def cached(self, scopes, ttl=None):
+        # scopes(**view_args) returns the version scopes the page depends on;
+        # ttl additionally expires pages whose content changes over time
+        def decorator(view):
+            @self.conditional(scopes, ttl)
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.is_cacheable_request():
+                    return view(*args, **kwargs)
+
+                # One entry per encoding the client negotiates: br, gzip or none
+                compress = current_app.extensions.get('compress')
+                encoding = compress.negotiate() if compress else None
+                versions = tuple(self.version(scope) for scope in scopes(**kwargs))
+                key = (request.endpoint, request.full_path, versions, encoding)
+
+                entry = self.pages.get(key)
+                if entry is not None and (entry[1] is None or entry[1] > monotonic()):
+                    _, _, body, mimetype, content_encoding = entry
+                    response = current_app.response_class(body, mimetype=mimetype)
+                    if content_encoding:
+                        response.headers['Content-Encoding'] = content_encoding
+                    response.vary.add('Accept-Encoding')
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                response = current_app.make_response(view(*args, **kwargs))
+                if (
+                    response.status_code == 200
+                    and not response.direct_passthrough
+                    and 'Set-Cookie' not in response.headers
+                    and not self._replica_may_lag(versions)
+                ):
+                    # Compressed here rather than after the request, so it is stored compressed;
+                    # the after-request pass skips it once Content-Encoding is set
+                    if compress:
+                        compress.compress(response)
+                    body = response.get_data()
+                    expires = monotonic() + ttl if ttl else None
+                    self.pages.set(key, (expires, body, response.mimetype, response.headers.get('Content-Encoding')), len(body))
+                    response.headers['X-Cache'] = 'MISS'
+                return response
+
+            return wrapper
+
+        return decorator
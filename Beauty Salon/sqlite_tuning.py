@@ -0,0 +1,85 @@
+"""Connection settings for running the app on SQLite with several workers.
+
+Every new SQLite connection gets the pragmas in SQLITE_PRAGMAS. The defaults
+switch the database to write-ahead logging, so readers no longer wait behind a
+writer, and give writers a busy timeout instead of an immediate "database is
+locked". In WAL mode a background thread per process also runs passive
+checkpoints, which keeps the -wal file from growing during long bursts of
+reads that block SQLite's own automatic checkpoints.
+"""
+import threading
+import time
+
+from sqlalchemy import event, text
+
+from per_process import PerProcess
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',  # safe across app crashes; a power cut can lose the last commits, never the file
+    'busy_timeout': 5000,  # milliseconds a writer waits for the lock
+    'cache_size': -64000,  # negative means KiB, so 64 MB of page cache per connection
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+class SQLiteTuning(PerProcess):
+    def __init__(self, app=None, db=None):
+        self.app = None
+        self.db = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault('SQLITE_PRAGMAS', dict(DEFAULT_PRAGMAS))
+        app.config.setdefault('SQLITE_CHECKPOINT_INTERVAL', 60.0)  # seconds; 0 disables the thread
+
+        self.app = app
+        self.db = db
+        app.extensions['sqlite_tuning'] = self
+
+        # The primary and any SQLite binds, such as a local read replica
+        with app.app_context():
+            engines = list(db.engines.values())
+        for engine in engines:
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', self._configure_connection)
+
+    def _configure_connection(self, dbapi_connection, connection_record):
+        # Runs once per new DBAPI connection, before the pool hands it out
+        apply_pragmas(dbapi_connection, self.app.config['SQLITE_PRAGMAS'])
+
+    @property
+    def uses_wal(self):
+        return str(self.app.config['SQLITE_PRAGMAS'].get('journal_mode', '')).upper() == 'WAL'
+
+    def checkpoint(self, mode='PASSIVE'):
+        # Returns (busy, wal frames, frames checkpointed) as reported by SQLite
+        with self.app.app_context():
+            with self.db.engine.connect() as connection:
+                return tuple(connection.execute(text(f"PRAGMA wal_checkpoint({mode})")).one())
+
+    def _start(self):
+        with self.app.app_context():
+            is_sqlite = self.db.engine.dialect.name == 'sqlite'
+        if is_sqlite and self.uses_wal and self.app.config['SQLITE_CHECKPOINT_INTERVAL']:
+            threading.Thread(target=self._run, name='sqlite-checkpoint', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.app.config['SQLITE_CHECKPOINT_INTERVAL'])
+            try:
+                self.checkpoint()
+            except Exception as e:
+                self.app.logger.error(f"Error checkpointing the SQLite WAL: {str(e)}")
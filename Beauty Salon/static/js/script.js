@@ -161,4 +161,67 @@ document.addEventListener('DOMContentLoaded', function() {
             this.querySelector('.salon-info').style.backgroundColor = '';
         });
     });
+
+    // Live notifications and appointment updates on the dashboards
+    const notificationList = document.querySelector('.notification-list[data-events-url]');
+    if (notificationList && window.EventSource) {
+        const events = new EventSource(notificationList.dataset.eventsUrl);
+
+        events.addEventListener('notification', function(e) {
+            const data = JSON.parse(e.data);
+            const emptyState = notificationList.querySelector('.empty-state');
+            if (emptyState) {
+                emptyState.remove();
+            }
+
+            const item = document.createElement('div');
+            item.className = 'notification-item';
+            item.dataset.id = data.id;
+
+            const content = document.createElement('div');
+            content.className = 'notification-content';
+            content.textContent = data.content;
+
+            const time = document.createElement('div');
+            time.className = 'notification-time';
+            time.textContent = data.time;
+
+            const button = document.createElement('button');
+            button.className = 'btn-mark-read';
+            button.innerHTML = '<i class="fas fa-check"></i>';
+            button.addEventListener('click', function() {
+                markNotificationRead(data.id);
+            });
+
+            item.append(content, time, button);
+            notificationList.prepend(item);
+        });
+
+        events.addEventListener('appointment', function(e) {
+            const data = JSON.parse(e.data);
+            const item = document.querySelector(`.appointment-item[data-appointment-id="${data.appointment_id}"]`);
+            const status = item ? item.querySelector('[class^="status-"]') : null;
+
+            if (status) {
+                status.className = `status-${data.status}`;
+                status.textContent = data.status.charAt(0).toUpperCase() + data.status.slice(1);
+            }
+
+            // Appointments move between lists, so offer a refresh instead of rebuilding them
+            if (!document.querySelector('.live-update-banner')) {
+                const banner = document.createElement('div');
+                banner.className = 'live-update-banner';
+                banner.innerHTML = 'Your appointments have changed. <a href="#">Refresh</a>';
+                banner.querySelector('a').addEventListener('click', function(event) {
+                    event.preventDefault();
+                    window.location.reload();
+                });
+                document.body.appendChild(banner);
+            }
+        });
+
+        window.addEventListener('beforeunload', function() {
+            events.close();
+        });
+    }
 });
\ No newline at end of file
@@ -0,0 +1,19 @@
+"""Entry point for pre-forking servers.
+
+    gunicorn --preload --workers 4 --worker-class gthread --threads 16 wsgi:app
+
+With --preload the master imports this module once, creates and warms up the
+app, and forks workers that start serving straight away. Set up the database
+beforehand with `flask --app app upgrade-db`.
+
+Use a threaded (gthread) or async (gevent) worker class. Every open dashboard
+keeps a live-update stream (/events) running for up to SSE_MAX_STREAM_SECONDS,
+which occupies one thread. Gunicorn's default sync workers would each be held
+by a single dashboard, so a handful of them would stop the whole site. For
+that reason /events is off unless the server reports wsgi.multithread, which
+gthread does. Under gevent, set FLASK_SSE_ENABLED=true.
+"""
+from app import create_app, warm_up
+
+app = create_app()
+warm_up(app)